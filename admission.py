@@ -0,0 +1,237 @@
+import json
+import math
+import os
+import time
+from urllib.parse import parse_qs
+
+# Admission control in front of every route: each user gets a token bucket and a
+# concurrency cap per cost class, and each expensive route a global concurrency
+# cap. Requests over budget are answered 429 at once instead of queueing for a
+# pooled connection.
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() in ["1", "true", "yes"]
+# JSON bodies up to this size are read to find the username of POST/PUT routes
+ADMISSION_MAX_BODY = int(os.getenv("ADMISSION_MAX_BODY", "65536"))
+# Idle token buckets are dropped once more than this many users are tracked
+ADMISSION_MAX_USERS = int(os.getenv("ADMISSION_MAX_USERS", "10000"))
+# Every worker process keeps its own counters, so each enforces its share of the budgets
+WEB_WORKERS = max(1, int(os.getenv("WEB_WORKERS", "1")))
+
+
+def _share(limit: int):
+    # Keeps 0 (no limit) as is and never rounds a limit down to nothing
+    return max(1, math.ceil(limit / WEB_WORKERS)) if limit else 0
+
+
+class Budget:
+    """Limits of one cost class; each can be overridden with ADMISSION_<CLASS>_<LIMIT>"""
+
+    def __init__(self, name: str, rate: float, burst: float, user_concurrency: int, route_concurrency: int):
+        prefix = f"ADMISSION_{name.upper()}_"
+        self.name = name
+        # Requests per second per user, sustained and in a burst
+        self.rate = float(os.getenv(prefix + "RATE", str(rate))) / WEB_WORKERS
+        self.burst = max(1.0, float(os.getenv(prefix + "BURST", str(burst))) / WEB_WORKERS)
+        # In-flight requests per user, and per route across all users (0 disables)
+        self.user_concurrency = _share(int(os.getenv(prefix + "USER_CONCURRENCY", str(user_concurrency))))
+        self.route_concurrency = _share(int(os.getenv(prefix + "ROUTE_CONCURRENCY", str(route_concurrency))))
+
+
+BUDGETS = {
+    budget.name: budget
+    for budget in [
+        Budget("default", rate=100, burst=200, user_concurrency=16, route_concurrency=0),
+        # Full table reads: scans, streams, exports, snapshots and filtered queries
+        Budget("scan", rate=5, burst=10, user_concurrency=2, route_concurrency=4),
+        Budget("drop", rate=1, burst=5, user_concurrency=1, route_concurrency=2),
+        # Whole-table updates and bulk loads
+        Budget("bulk", rate=2, burst=5, user_concurrency=1, route_concurrency=2),
+    ]
+}
+
+# Probes, stats and the UI are never limited
+EXEMPT_PATHS = {"/", "/ready", "/metrics", "/cache_stats", "/docs", "/redoc", "/openapi.json"}
+EXEMPT_PREFIXES = ("/static/",)
+
+
+def classify(method: str, path: str, query: dict, body: dict):
+    """Cost class of a request and the route key its global cap is counted under"""
+    if method == "DELETE" and path.startswith(("/delete_table/", "/async/delete_table/")):
+        return "drop", "DELETE /delete_table"
+    if method == "PUT" and path == "/update_table" and body.get("new_age") is not None:
+        return "bulk", "PUT /update_table"
+    if method == "POST" and path == "/insert_data/bulk":
+        return "bulk", "POST /insert_data/bulk"
+    if method == "GET" and path in ("/get_info_table/stream", "/export_table", "/snapshot"):
+        return "scan", f"GET {path}"
+    if method == "GET" and path in ("/get_info_table", "/async/get_info_table") and "limit" not in query:
+        return "scan", "GET /get_info_table"
+    if method == "GET" and path == "/get_all_tables" and query.get("exact_counts", ["false"])[0].lower() in ["1", "true", "yes"]:
+        return "scan", "GET /get_all_tables"
+    if method == "POST" and path == "/query_table":
+        return "scan", "POST /query_table"
+    return "default", None
+
+
+class AdmissionControl:
+    """Token buckets and in-flight counters; only touched from the event loop, so no locking"""
+
+    def __init__(self, budgets):
+        self.budgets = budgets
+        # (user, class) -> [tokens, last refill]
+        self._buckets = {}
+        self._user_active = {}
+        self._route_active = {}
+        self.admitted = 0
+        self.rejected = {}
+
+    def admit(self, username: str, cost_class: str, route: str):
+        """Count the request in, or return (reason, retry after seconds) when it is over budget"""
+        budget = self.budgets[cost_class]
+        user_key = (username, cost_class)
+        rejection = self._check_concurrency(user_key, route, budget)
+        if rejection is None:
+            rejection = self._take_token(user_key, budget)
+        if rejection is not None:
+            self.rejected[(cost_class, rejection[0])] = self.rejected.get((cost_class, rejection[0]), 0) + 1
+            return rejection
+
+        self.admitted += 1
+        self._user_active[user_key] = self._user_active.get(user_key, 0) + 1
+        if route is not None:
+            self._route_active[route] = self._route_active.get(route, 0) + 1
+        return None
+
+    def release(self, username: str, cost_class: str, route: str):
+        self._release(self._user_active, (username, cost_class))
+        if route is not None:
+            self._release(self._route_active, route)
+
+    def _check_concurrency(self, user_key, route, budget: Budget):
+        if budget.user_concurrency and self._user_active.get(user_key, 0) >= budget.user_concurrency:
+            return "user concurrency", 1
+        if route is not None and budget.route_concurrency and self._route_active.get(route, 0) >= budget.route_concurrency:
+            return "route concurrency", 1
+        return None
+
+    def _take_token(self, user_key, budget: Budget):
+        if budget.rate <= 0:
+            return None
+        now = time.monotonic()
+        bucket = self._buckets.get(user_key)
+        if bucket is None:
+            if len(self._buckets) >= ADMISSION_MAX_USERS:
+                self._drop_idle_buckets(now)
+            bucket = self._buckets[user_key] = [budget.burst, now]
+        bucket[0] = min(budget.burst, bucket[0] + (now - bucket[1]) * budget.rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            return "rate", math.ceil((1 - bucket[0]) / budget.rate)
+        bucket[0] -= 1
+        return None
+
+    def _drop_idle_buckets(self, now: float):
+        # A bucket that has refilled to its burst behaves exactly like a new one
+        for key, (tokens, last) in list(self._buckets.items()):
+            budget = self.budgets[key[1]]
+            if tokens + (now - last) * budget.rate >= budget.burst:
+                del self._buckets[key]
+
+    @staticmethod
+    def _release(counters, key):
+        counters[key] -= 1
+        if not counters[key]:
+            del counters[key]
+
+    def stats(self):
+        return {
+            "enabled": ADMISSION_CONTROL,
+            "admitted": self.admitted,
+            "rejected": {f"{cost_class}:{reason}": count for (cost_class, reason), count in sorted(self.rejected.items())},
+            "in_flight": {f"{user}:{cost_class}": count for (user, cost_class), count in self._user_active.items()},
+            "budgets": {name: vars(budget) for name, budget in self.budgets.items()},
+        }
+
+
+admission_control = AdmissionControl(BUDGETS)
+
+
+class AdmissionMiddleware:
+    """ASGI middleware putting every request through admission_control before the app sees it"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not ADMISSION_CONTROL or path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        body = {}
+        username = query.get("username", [None])[0]
+        if username is None or scope["method"] == "PUT":
+            body, receive = await self._read_json_body(scope, receive)
+            username = username or body.get("username")
+        if not isinstance(username, str):
+            # Requests without a username are limited per client address
+            client = scope.get("client")
+            username = f"client:{client[0] if client else 'unknown'}"
+
+        cost_class, route = classify(scope["method"], path, query, body)
+        rejection = admission_control.admit(username, cost_class, route)
+        if rejection is not None:
+            await self._reject(send, cost_class, *rejection)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission_control.release(username, cost_class, route)
+
+    async def _read_json_body(self, scope, receive):
+        """Parse a small JSON body and return it with a receive that replays it downstream"""
+        headers = dict(scope.get("headers", []))
+        content_type = headers.get(b"content-type", b"").decode("latin-1")
+        length = headers.get(b"content-length")
+        if "json" not in content_type or length is None or int(length) > ADMISSION_MAX_BODY:
+            return {}, receive
+
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] != "http.request":
+                # The client went away; let the app see the disconnect
+                return {}, self._replay(message, receive)
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        raw = b"".join(chunks)
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            body = {}
+        replayed = {"type": "http.request", "body": raw, "more_body": False}
+        return body if isinstance(body, dict) else {}, self._replay(replayed, receive)
+
+    @staticmethod
+    def _replay(message, receive):
+        pending = [message]
+
+        async def replay():
+            return pending.pop() if pending else await receive()
+
+        return replay
+
+    @staticmethod
+    async def _reject(send, cost_class: str, reason: str, retry_after: int):
+        body = json.dumps({"detail": f"Too many requests: {reason} limit of the '{cost_class}' budget reached"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,224 @@
+"""Throughput and latency benchmark for the table endpoints.
+
+Creates a throwaway database next to the one named by BENCH_ADMIN_URL, points
+the app at it, and drives create / single insert / read-all / update / delete
+through FastAPI's TestClient at several table sizes and concurrency levels.
+With --url a running server is benchmarked instead, on its own database; the
+benchmark tables are dropped again by the delete step. Results are written as
+JSON; pass --compare with an earlier result file to report regressions.
+
+    python benchmarks/bench_endpoints.py --sizes 100 10000 --concurrency 1 8 32
+    python benchmarks/bench_endpoints.py --output new.json --compare old.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ADMIN_URL = "postgresql://postgres:@localhost:5432/postgres"
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(op, table_size, concurrency, latencies, errors, elapsed):
+    values = sorted(latencies)
+    return {
+        "op": op,
+        "table_size": table_size,
+        "concurrency": concurrency,
+        "requests": len(values) + errors,
+        "errors": errors,
+        "throughput_rps": len(values) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(values) if values else 0.0,
+        "p50_ms": percentile(values, 0.50),
+        "p95_ms": percentile(values, 0.95),
+        "p99_ms": percentile(values, 0.99),
+    }
+
+
+def run_load(client, concurrency, calls):
+    """Run (method, url, kwargs) calls over `concurrency` threads; returns latencies, errors, elapsed"""
+    latencies = []
+    errors = 0
+
+    def one(call):
+        method, url, kwargs = call
+        start = time.perf_counter()
+        response = client.request(method, url, **kwargs)
+        return (time.perf_counter() - start) * 1000, response.status_code < 400
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for latency, ok in pool.map(one, calls):
+            if ok:
+                latencies.append(latency)
+            else:
+                errors += 1
+    return latencies, errors, time.perf_counter() - start
+
+
+def populate(client, table_name, rows):
+    body = "\n".join(json.dumps({"name": f"user{i}", "age": i % 100}) for i in range(rows))
+    response = client.post(
+        "/insert_data/bulk",
+        params={"table_name": table_name, "username": "role1"},
+        content=body,
+        headers={"content-type": "application/x-ndjson"},
+    )
+    response.raise_for_status()
+
+
+def bench_size(client, table_size, concurrency, requests, prefix):
+    results = []
+    tables = [f"{prefix}_{table_size}_{concurrency}_{i}" for i in range(requests)]
+
+    calls = [("POST", "/create_table", {"json": {"table_name": name, "username": "role1"}}) for name in tables]
+    results.append(summarize("create", table_size, concurrency, *run_load(client, concurrency, calls)))
+
+    table = tables[0]
+    populate(client, table, table_size)
+
+    calls = [
+        ("POST", "/insert_data", {"json": {"table_name": table, "name": f"bench{i}", "age": i % 100, "username": "role1"}})
+        for i in range(requests)
+    ]
+    results.append(summarize("insert", table_size, concurrency, *run_load(client, concurrency, calls)))
+
+    calls = [("GET", "/get_info_table", {"params": {"username": "role2", "table_name": table}})] * requests
+    results.append(summarize("read_all", table_size, concurrency, *run_load(client, concurrency, calls)))
+
+    calls = [
+        ("PUT", "/update_table", {"json": {"table_name": table, "new_age": i % 100, "username": "role3"}})
+        for i in range(requests)
+    ]
+    results.append(summarize("update", table_size, concurrency, *run_load(client, concurrency, calls)))
+
+    calls = [("DELETE", f"/delete_table/{name}", {"params": {"username": "role2"}}) for name in tables]
+    results.append(summarize("delete", table_size, concurrency, *run_load(client, concurrency, calls)))
+    return results
+
+
+def compare(results, baseline_path, tolerance):
+    """Print p95 and throughput changes against a baseline run; returns the number of regressions"""
+    with open(baseline_path) as f:
+        baseline = {(r["op"], r["table_size"], r["concurrency"]): r for r in json.load(f)["results"]}
+    regressions = 0
+    for result in results:
+        old = baseline.get((result["op"], result["table_size"], result["concurrency"]))
+        if old is None or not old["p95_ms"]:
+            continue
+        p95_change = result["p95_ms"] / old["p95_ms"] - 1
+        rps_change = result["throughput_rps"] / old["throughput_rps"] - 1 if old["throughput_rps"] else 0.0
+        regressed = p95_change > tolerance
+        regressions += regressed
+        print(
+            f"{result['op']:>8} size={result['table_size']:<7} c={result['concurrency']:<4} "
+            f"p95 {old['p95_ms']:8.2f} -> {result['p95_ms']:8.2f} ms ({p95_change:+.0%})  "
+            f"rps {rps_change:+.0%}{'  REGRESSION' if regressed else ''}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10000])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="requests per operation and level")
+    parser.add_argument("--url", help="benchmark a running server instead of an in-process TestClient")
+    parser.add_argument("--response-cache", action="store_true", help="keep the response cache enabled")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown before flagging")
+    args = parser.parse_args()
+
+    admin_url = make_url(os.getenv("BENCH_ADMIN_URL", DEFAULT_ADMIN_URL))
+    database = f"daniam_bench_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(admin_url, isolation_level="AUTOCOMMIT")
+    if not args.url:
+        with admin.connect() as connection:
+            connection.execute(text(f'CREATE DATABASE "{database}"'))
+        # The app reads its configuration at import time
+        os.environ["DATABASE_URL"] = admin_url.set(database=database).render_as_string(hide_password=False)
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+        if not args.response_cache:
+            os.environ["RESPONSE_CACHE_BACKEND"] = "none"
+        # The benchmark deliberately exceeds the per-user budgets
+        os.environ["ADMISSION_CONTROL"] = "false"
+
+    try:
+        if args.url:
+            import httpx
+
+            client = httpx.Client(base_url=args.url, timeout=300)
+        else:
+            sys.path.insert(0, ROOT)
+            os.chdir(ROOT)
+            from fastapi.testclient import TestClient
+            import main as app_module
+
+            client = TestClient(app_module.app).__enter__()
+        client.post("/init-system")
+
+        results = []
+        prefix = f"bench_{uuid.uuid4().hex[:6]}"
+        for table_size in args.sizes:
+            for concurrency in args.concurrency:
+                for result in bench_size(client, table_size, concurrency, args.requests, prefix):
+                    results.append(result)
+                    print(
+                        f"{result['op']:>8} size={table_size:<7} c={concurrency:<4} "
+                        f"{result['throughput_rps']:9.1f} req/s  p50 {result['p50_ms']:8.2f}  "
+                        f"p95 {result['p95_ms']:8.2f}  p99 {result['p99_ms']:8.2f} ms  errors {result['errors']}"
+                    )
+        if args.url:
+            client.close()
+        else:
+            client.__exit__(None, None, None)
+            import database as app_database
+
+            app_database.engine.dispose()
+    finally:
+        if not args.url:
+            with admin.connect() as connection:
+                connection.execute(text(f'DROP DATABASE IF EXISTS "{database}" WITH (FORCE)'))
+        admin.dispose()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "target": args.url or "testclient",
+            "python": platform.python_version(),
+            "sizes": args.sizes,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "response_cache": args.response_cache,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
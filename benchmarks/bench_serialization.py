@@ -0,0 +1,111 @@
+"""Serialization benchmark for large get_info_table responses.
+
+Builds result rows shaped like a create_table table (id, name, created_at, age)
+in memory, with no database, and times the two ways the API can render them:
+
+    stdlib  dict(row._mapping) per row, jsonable_encoder, then the stdlib json module
+    orjson  the column list zipped with each row tuple, encoded by orjson
+
+Both outputs are decoded and compared before timing. Results are written as JSON.
+
+    python benchmarks/bench_serialization.py --rows 1000 10000 100000
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.engine.result import IteratorResult, SimpleResultMetaData
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from serialization import dumps, orjson, rows_to_dicts  # noqa: E402
+
+COLUMNS = ("id", "name", "created_at", "age")
+
+
+def make_result(rows):
+    start = datetime(2024, 1, 1, 12, 0, 0, 123456)
+    tuples = [(i, f"user{i}", start + timedelta(seconds=i), i % 100) for i in range(1, rows + 1)]
+    return IteratorResult(SimpleResultMetaData(COLUMNS), iter(tuples))
+
+
+def render_stdlib(result):
+    rows = result.fetchall()
+    return JSONResponse(jsonable_encoder({"table_info": [dict(row._mapping) for row in rows]})).body
+
+
+def render_orjson(result):
+    return dumps({"table_info": rows_to_dicts(result.keys(), result.fetchall())})
+
+
+RENDERERS = {"stdlib": render_stdlib, "orjson": render_orjson}
+
+
+def measure(render, rows, repeat):
+    timings = []
+    for _ in range(repeat):
+        # Building the rows stands in for the fetch and is not timed
+        result = make_result(rows)
+        start = time.perf_counter()
+        body = render(result)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per renderer and size")
+    parser.add_argument("--output", default="bench_serialization.json")
+    args = parser.parse_args()
+
+    if orjson is None:
+        print("orjson is not installed; the orjson column measures the stdlib fallback")
+
+    results = []
+    for rows in args.rows:
+        expected = json.loads(render_stdlib(make_result(rows)))
+        if json.loads(render_orjson(make_result(rows))) != expected:
+            sys.exit(f"orjson output differs from the stdlib output at {rows} rows")
+
+        by_renderer = {}
+        for name, render in RENDERERS.items():
+            timings, size = measure(render, rows, args.repeat)
+            by_renderer[name] = statistics.median(timings)
+            results.append({
+                "renderer": name,
+                "rows": rows,
+                "median_ms": statistics.median(timings),
+                "min_ms": min(timings),
+                "bytes": size,
+                "rows_per_s": rows / (statistics.median(timings) / 1000) if timings else 0.0,
+            })
+        print(
+            f"rows={rows:<8} stdlib {by_renderer['stdlib']:9.2f} ms  orjson {by_renderer['orjson']:9.2f} ms  "
+            f"speedup {by_renderer['stdlib'] / by_renderer['orjson']:5.1f}x"
+        )
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "orjson": getattr(orjson, "__version__", None),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Import, warm-up and first-request latency of the app.
+
+Creates a throwaway database next to the one named by BENCH_ADMIN_URL, sets it
+up through /init-system with one populated table, then starts the app in fresh
+processes with the startup warm-up disabled (WARMUP=false, the cold behaviour)
+and enabled. For each process it measures the import of main, the time until
+/ready reports ready, and the first and second call of a few endpoints.
+Medians over --runs processes are printed and written as JSON.
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ADMIN_URL = "postgresql://postgres:@localhost:5432/postgres"
+TABLE = "bench_startup"
+
+REQUESTS = {
+    "get_all_tables": ("GET", "/get_all_tables", {"params": {"username": "role2"}}),
+    "get_info_table": ("GET", "/get_info_table", {"params": {"username": "role2", "table_name": TABLE}}),
+    "insert_data": ("POST", "/insert_data", {"json": {"table_name": TABLE, "name": "x", "age": 1, "username": "role1"}}),
+}
+
+
+def child(setup: bool):
+    """Runs inside a fresh interpreter; prints one JSON line of timings"""
+    start = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import main
+
+    import_ms = (time.perf_counter() - start) * 1000
+    from fastapi.testclient import TestClient
+
+    client = TestClient(main.app).__enter__()
+    if setup:
+        client.post("/init-system").raise_for_status()
+        client.post("/create_table", json={"table_name": TABLE, "username": "role1"}).raise_for_status()
+        body = "\n".join(json.dumps({"name": f"user{i}", "age": i % 100}) for i in range(1000))
+        client.post(
+            "/insert_data/bulk",
+            params={"table_name": TABLE, "username": "role1"},
+            content=body,
+            headers={"content-type": "application/x-ndjson"},
+        ).raise_for_status()
+        client.__exit__(None, None, None)
+        return
+
+    while client.get("/ready").status_code != 200:
+        time.sleep(0.005)
+    timings = {"import_ms": import_ms, "ready_ms": (time.perf_counter() - start) * 1000 - import_ms}
+    for name, (method, url, kwargs) in REQUESTS.items():
+        for attempt in ("first", "second"):
+            request_start = time.perf_counter()
+            client.request(method, url, **kwargs).raise_for_status()
+            timings[f"{name}_{attempt}_ms"] = (time.perf_counter() - request_start) * 1000
+    client.__exit__(None, None, None)
+    print(json.dumps(timings))
+
+
+def run_child(env, setup=False):
+    args = [sys.executable, os.path.abspath(__file__), "--child"] + (["--setup"] if setup else [])
+    output = subprocess.run(args, env=env, check=True, capture_output=True, text=True).stdout
+    return None if setup else json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="processes per mode")
+    parser.add_argument("--output", default="bench_startup.json")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--setup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.setup)
+        return
+
+    admin_url = make_url(os.getenv("BENCH_ADMIN_URL", DEFAULT_ADMIN_URL))
+    database = f"daniam_bench_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(admin_url, isolation_level="AUTOCOMMIT")
+    with admin.connect() as connection:
+        connection.execute(text(f'CREATE DATABASE "{database}"'))
+
+    env = dict(os.environ)
+    env["DATABASE_URL"] = admin_url.set(database=database).render_as_string(hide_password=False)
+    env.pop("ASYNC_DATABASE_URL", None)
+    env["RESPONSE_CACHE_BACKEND"] = "memory"
+    results = {}
+    try:
+        run_child({**env, "WARMUP": "false"}, setup=True)
+        for mode in ("cold", "warm"):
+            mode_env = {**env, "WARMUP": "true" if mode == "warm" else "false"}
+            runs = [run_child(mode_env) for _ in range(args.runs)]
+            results[mode] = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    finally:
+        with admin.connect() as connection:
+            connection.execute(text(f'DROP DATABASE IF EXISTS "{database}" WITH (FORCE)'))
+        admin.dispose()
+
+    for key in results["cold"]:
+        cold, warm = results["cold"][key], results["warm"][key]
+        print(f"{key:<28} cold {cold:9.2f} ms   warm {warm:9.2f} ms")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "runs": args.runs,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Throughput scaling of serve.py with the number of worker processes.
+
+Creates a throwaway database next to the one named by BENCH_ADMIN_URL and
+fills one table. For each worker count it then starts serve.py on a free port,
+drives a fixed-duration load through several client processes, and stops the
+server with SIGTERM, timing how long the drain takes. Results, with the speedup
+over the first worker count, are printed and written as JSON.
+
+Admission control and the response cache are off, so every request does its
+real work. serve.py turns the per-process response cache off for several
+workers anyway, so this also keeps the worker counts comparable.
+
+    python benchmarks/bench_workers.py --workers 1 2 4 8 --concurrency 64 --duration 10
+    python benchmarks/bench_workers.py --workers 1 4 --preload
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import httpx
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ADMIN_URL = "postgresql://postgres:@localhost:5432/postgres"
+TABLE = "bench_workers"
+ROWS = 10000
+
+OPERATIONS = {
+    "read_page": ("GET", "/get_info_table", {"params": {"username": "role2", "table_name": TABLE, "limit": 100}}),
+    "list_tables": ("GET", "/get_all_tables", {"params": {"username": "role2"}}),
+    "insert": ("POST", "/insert_data", {"json": {"table_name": TABLE, "name": "bench", "age": 1, "username": "role1"}}),
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def client_process(base_url, operation, threads, duration):
+    """One load-generating process: `threads` threads calling the operation until the deadline"""
+    method, url, kwargs = OPERATIONS[operation]
+    deadline = time.perf_counter() + duration
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def loop():
+        nonlocal errors
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    ok = client.request(method, url, **kwargs).status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    if ok:
+                        latencies.append(elapsed)
+                    else:
+                        errors += 1
+
+    workers = [threading.Thread(target=loop) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, errors
+
+
+def drive(base_url, operation, concurrency, clients, duration):
+    clients = min(clients, concurrency)
+    shares = [concurrency // clients + (i < concurrency % clients) for i in range(clients)]
+    latencies = []
+    errors = 0
+    with ProcessPoolExecutor(max_workers=clients) as pool:
+        futures = [pool.submit(client_process, base_url, operation, threads, duration) for threads in shares]
+        for future in futures:
+            part, part_errors = future.result()
+            latencies.extend(part)
+            errors += part_errors
+    latencies.sort()
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": len(latencies) / duration,
+        "mean_ms": statistics.fmean(latencies) if latencies else 0.0,
+        "p50_ms": percentile(latencies, 0.50),
+        "p99_ms": percentile(latencies, 0.99),
+    }
+
+
+def start_server(env, workers, preload):
+    port = free_port()
+    args = [sys.executable, os.path.join(ROOT, "serve.py"), "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning"] + (["--preload"] if preload else [])
+    process = subprocess.Popen(args, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    ready = 0
+    # Every worker answers /ready on its own, so wait for a run of successes
+    while ready < 4 * workers:
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError(f"serve.py with {workers} workers did not become ready")
+        try:
+            ready = ready + 1 if httpx.get(base_url + "/ready", timeout=5).status_code == 200 else 0
+        except httpx.HTTPError:
+            ready = 0
+            time.sleep(0.2)
+    return process, base_url
+
+
+def stop_server(process):
+    """SIGTERM the server and return how long it took to drain and exit"""
+    start = time.perf_counter()
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=120)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    return (time.perf_counter() - start) * 1000
+
+
+def populate(base_url):
+    with httpx.Client(base_url=base_url, timeout=300) as client:
+        client.post("/init-system").raise_for_status()
+        client.post("/create_table", json={"table_name": TABLE, "username": "role1"}).raise_for_status()
+        body = "\n".join(json.dumps({"name": f"user{i}", "age": i % 100}) for i in range(ROWS))
+        client.post(
+            "/insert_data/bulk",
+            params={"table_name": TABLE, "username": "role1"},
+            content=body,
+            headers={"content-type": "application/x-ndjson"},
+        ).raise_for_status()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent client connections")
+    parser.add_argument("--clients", type=int, default=4, help="load-generating processes")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per operation and worker count")
+    parser.add_argument("--operations", nargs="+", default=list(OPERATIONS), choices=list(OPERATIONS))
+    parser.add_argument("--preload", action="store_true", help="run serve.py under gunicorn with --preload")
+    parser.add_argument("--output", default="bench_workers.json")
+    args = parser.parse_args()
+
+    admin_url = make_url(os.getenv("BENCH_ADMIN_URL", DEFAULT_ADMIN_URL))
+    database = f"daniam_bench_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(admin_url, isolation_level="AUTOCOMMIT")
+    with admin.connect() as connection:
+        connection.execute(text(f'CREATE DATABASE "{database}"'))
+
+    env = dict(os.environ)
+    env["DATABASE_URL"] = admin_url.set(database=database).render_as_string(hide_password=False)
+    env.pop("ASYNC_DATABASE_URL", None)
+    env.update({"ADMISSION_CONTROL": "false", "RESPONSE_CACHE_BACKEND": "none"})
+
+    results = []
+    try:
+        for index, workers in enumerate(args.workers):
+            process, base_url = start_server(env, workers, args.preload)
+            try:
+                if index == 0:
+                    populate(base_url)
+                for operation in args.operations:
+                    result = drive(base_url, operation, args.concurrency, args.clients, args.duration)
+                    result.update(operation=operation, workers=workers)
+                    results.append(result)
+            finally:
+                shutdown_ms = stop_server(process)
+            for result in results[-len(args.operations):]:
+                result["shutdown_ms"] = shutdown_ms
+    finally:
+        with admin.connect() as connection:
+            connection.execute(text(f'DROP DATABASE IF EXISTS "{database}" WITH (FORCE)'))
+        admin.dispose()
+
+    baseline = {r["operation"]: r["throughput_rps"] for r in results if r["workers"] == args.workers[0]}
+    for result in results:
+        base = baseline[result["operation"]]
+        result["speedup"] = result["throughput_rps"] / base if base else 0.0
+        print(
+            f"{result['operation']:>12} workers={result['workers']:<3} {result['throughput_rps']:9.1f} req/s  "
+            f"x{result['speedup']:4.2f}  p50 {result['p50_ms']:8.2f}  p99 {result['p99_ms']:8.2f} ms  "
+            f"errors {result['errors']}  shutdown {result['shutdown_ms']:7.0f} ms"
+        )
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "workers": args.workers,
+            "concurrency": args.concurrency,
+            "clients": args.clients,
+            "duration": args.duration,
+            "preload": args.preload,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+from starlette.concurrency import run_in_threadpool
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries expire after `ttl` seconds"""
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or entry[0] < time.monotonic():
+                if entry is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, *keys):
+        """Drop the given keys, or every entry when called without arguments"""
+        with self._lock:
+            if not keys:
+                self._data.clear()
+            for key in keys:
+                self._data.pop(key, None)
+
+    def invalidate_matching(self, predicate):
+        """Drop every key for which predicate(key) is true"""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Worker processes started by serve.py. Each keeps its own schema and role caches
+# and only sees its own invalidations, so with several workers a table or user
+# created elsewhere must not be remembered as missing.
+WEB_WORKERS = max(1, int(os.getenv("WEB_WORKERS", "1")))
+
+# Table existence and name/age column layout, keyed by table name
+schema_cache = TTLCache(
+    ttl=float(os.getenv("SCHEMA_CACHE_TTL", "60")),
+    maxsize=int(os.getenv("SCHEMA_CACHE_SIZE", "1024")),
+)
+
+# Role membership map loaded from pg_auth_members, stored under a single key
+role_cache = TTLCache(
+    ttl=float(os.getenv("ROLE_CACHE_TTL", "60")),
+    maxsize=1,
+)
+
+
+class MemoryResponseBackend:
+    """Response store in an in-process TTL/LRU cache"""
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.cache = TTLCache(ttl=ttl, maxsize=maxsize)
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def generation(self, endpoint: str, table_name: str):
+        with self._lock:
+            return self._generations.get((endpoint, table_name), 0)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, generation: int):
+        # Under the lock so an invalidation cannot slip in between the check and the store
+        with self._lock:
+            if self._generations.get(key[:2], 0) == generation:
+                self.cache.set(key, value)
+
+    def delete(self, endpoint: str, table_name: str):
+        with self._lock:
+            key = (endpoint, table_name)
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self.cache.invalidate_matching(lambda cached: cached[:2] == key)
+
+    def stats(self):
+        return {"backend": "memory", **self.cache.stats()}
+
+
+class RedisResponseBackend:
+    """Response store in a Redis-compatible server, shared by every worker.
+
+    Each table's entries are keyed under its current generation, so invalidating
+    is a single INCR: entries of older generations are never read again and
+    expire with the TTL, and a body built before a write lands under a
+    generation that is already stale.
+    """
+
+    prefix = "daniam:response"
+    generation_prefix = "daniam:response-generation"
+    # Makes the network calls block, so async code invalidates from the threadpool
+    blocking = True
+
+    def __init__(self, url: str, ttl: float):
+        import redis  # Optional dependency, only needed for this backend
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _table(endpoint: str, table_name: str):
+        # Table names may contain the ':' separator
+        return f"{endpoint}:{quote(table_name, safe='')}"
+
+    def _key(self, key, generation: int):
+        endpoint, table_name, variant = key
+        return f"{self.prefix}:{self._table(endpoint, table_name)}:{generation}:{variant}"
+
+    def _generation_key(self, endpoint: str, table_name: str):
+        return f"{self.generation_prefix}:{self._table(endpoint, table_name)}"
+
+    def generation(self, endpoint: str, table_name: str):
+        return int(self.client.get(self._generation_key(endpoint, table_name)) or 0)
+
+    def get(self, key):
+        value = self.client.get(self._key(key, self.generation(*key[:2])))
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        etag, _, body = value.partition(b"\n")
+        return body, etag.decode()
+
+    def set(self, key, value, generation: int):
+        body, etag = value
+        self.client.set(self._key(key, generation), etag.encode() + b"\n" + body, ex=max(1, int(self.ttl)))
+
+    def delete(self, endpoint: str, table_name: str):
+        self.client.incr(self._generation_key(endpoint, table_name))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": "redis",
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class ResponseCache:
+    """Serialized read responses keyed by (endpoint, table, variant), with ETags"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def etag(body: bytes):
+        return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+    def generation(self, endpoint: str, table_name: str = ""):
+        """Counter bumped on every invalidation, so a read that raced with a write is not stored"""
+        if self.backend is None:
+            return 0
+        return self.backend.generation(endpoint, table_name)
+
+    def get(self, endpoint: str, table_name: str = "", variant: str = ""):
+        """Get a cached (body, etag) pair"""
+        if self.backend is None:
+            return None
+        return self.backend.get((endpoint, table_name, variant))
+
+    def set(self, endpoint: str, table_name: str, variant: str, body: bytes, generation: int):
+        """Store a response built while the table was at `generation`; returns its ETag"""
+        etag = self.etag(body)
+        if self.backend is not None:
+            self.backend.set((endpoint, table_name, variant), (body, etag), generation)
+        return etag
+
+    def invalidate(self, endpoint: str, table_name: str):
+        if self.backend is not None:
+            self.backend.delete(endpoint, table_name)
+
+    def invalidate_tables(self, *table_names):
+        """Forget cached contents of the given tables"""
+        for table_name in table_names:
+            if table_name:
+                self.invalidate("get_info_table", table_name)
+
+    def invalidate_table_list(self):
+        """Forget the cached table listing"""
+        self.invalidate("get_all_tables", "")
+
+    async def invalidate_async(self, *table_names, table_list: bool = False):
+        """invalidate_tables, and invalidate_table_list when asked, without blocking the event loop"""
+
+        def invalidate():
+            self.invalidate_tables(*table_names)
+            if table_list:
+                self.invalidate_table_list()
+
+        if getattr(self.backend, "blocking", False):
+            await run_in_threadpool(invalidate)
+        else:
+            invalidate()
+
+    def stats(self):
+        return self.backend.stats() if self.backend is not None else {"backend": "none"}
+
+
+def _response_backend():
+    backend = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+    ttl = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+    if backend == "memory":
+        return MemoryResponseBackend(ttl=ttl, maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "256")))
+    if backend == "redis":
+        return RedisResponseBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"), ttl=ttl)
+    if backend == "none":
+        return None
+    raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND '{backend}'")
+
+
+# Read responses, invalidated by the mutating functions in crud.py
+response_cache = ResponseCache(_response_backend())
@@ -1,71 +1,131 @@
+import csv
+import io
+import json
+import os
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from fastapi import HTTPException
-from models import UpdateTableRequest, CreateTableAdmin
+from typing import Optional, List
+from models import UpdateTableRequest, CreateTableAdmin, QueryTableRequest
+from cache import WEB_WORKERS, schema_cache, role_cache, response_cache
+from jobs import ensure_jobs_table, create_job
+from serialization import rows_to_dicts
+from statements import statement, quote, quote_text
+from database import is_replica_session
+
+BULK_INSERT_CHUNK_SIZE = int(os.getenv("BULK_INSERT_CHUNK_SIZE", "5000"))
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "1000"))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "10000"))
 
 def test_query(db: Session):
     query = text("SELECT * from pg_statistic")
     result = db.execute(query).mappings().all()
     return result
 
+def _role_exists(db: Session, role: str):
+    query = text("SELECT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = :role);")
+    return db.execute(query, {"role": role}).scalar()
+
 def create_roles(db: Session):
     """Create the three roles in the database"""
     try:
-        # Create roles
+        # Create roles; a failed CREATE would abort the whole transaction, so skip existing ones
         for role in ["role1", "role2", "role3"]:
-            query = text(f"CREATE ROLE {role} WITH LOGIN;")
-            try:
-                db.execute(query)
-            except Exception:
-                pass  # Role might already exist
+            if not _role_exists(db, role):
+                db.execute(text(f"CREATE ROLE {role} WITH LOGIN;"))
         
         db.commit()
         return "Roles created successfully"
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error creating roles: {str(e)}")
+    finally:
+        role_cache.invalidate()
 
 def create_user(user: CreateTableAdmin, db: Session):
     """Create a user with a role"""
     try:
         # Create user
-        query = text(f"CREATE USER {user.username} WITH LOGIN;")
-        try:
-            db.execute(query)
-        except Exception:
-            pass  # User might already exist
+        if not _role_exists(db, user.username):
+            db.execute(text(f"CREATE USER {user.username} WITH LOGIN;"))
 
-        # Grant role
-        query = text(f"GRANT {user.role} TO {user.username};")
-        db.execute(query)
+        # Grant role (a role is already a member of itself)
+        if user.role != user.username:
+            query = text(f"GRANT {user.role} TO {user.username};")
+            db.execute(query)
         
         db.commit()
         return f"User {user.username} created and granted role {user.role}"
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error creating user: {str(e)}")
+    finally:
+        role_cache.invalidate()
+
+# Every role paired with each role it belongs to, directly or through nested
+# grants; a role always counts as a member of itself
+ROLE_MEMBERSHIP_QUERY = text("""
+    WITH RECURSIVE membership(member, roleid) AS (
+        SELECT oid, oid FROM pg_roles
+        UNION
+        SELECT m.member, am.roleid
+        FROM membership m
+        JOIN pg_auth_members am ON am.member = m.roleid
+    )
+    SELECT member_role.rolname, granted_role.rolname
+    FROM membership m
+    JOIN pg_roles member_role ON member_role.oid = m.member
+    JOIN pg_roles granted_role ON granted_role.oid = m.roleid;
+""")
+
+def build_role_memberships(rows):
+    """Map each role name to the set of role names it is a member of"""
+    memberships = {}
+    for member, role in rows:
+        memberships.setdefault(member, set()).add(role)
+    return memberships
+
+def get_role_memberships(db: Session):
+    """Get the role membership map, served from the role cache when possible"""
+    memberships = role_cache.get("memberships")
+    if memberships is None:
+        memberships = build_role_memberships(db.execute(ROLE_MEMBERSHIP_QUERY).all())
+        role_cache.set("memberships", memberships)
+    return memberships
 
 def get_user_role(db: Session, username: str):
     """Get the role of a user"""
-    query = text("""
-        SELECT rolname 
-        FROM pg_roles 
-        WHERE rolname = :username;
-    """)
-    result = db.execute(query, {"username": username}).fetchone()
-    return result[0] if result else None
+    return username if username in get_role_memberships(db) else None
+
+PERMISSION_DENIED = {
+    "role1": "Permission denied: Only role1 can create tables and insert data",
+    "role2": "Permission denied: Only role2 can view and delete tables",
+    "role3": "Permission denied: Only role3 can update tables",
+}
+
+def is_member(memberships, username: str, role: str):
+    return role in memberships.get(username, ())
+
+def check_role_membership(memberships, username: str, role: str):
+    if not is_member(memberships, username, role):
+        raise HTTPException(status_code=403, detail=PERMISSION_DENIED[role])
+
+def check_role(db: Session, username: str, role: str):
+    memberships = get_role_memberships(db)
+    if WEB_WORKERS > 1 and not is_member(memberships, username, role):
+        # The user may have just been created or granted on another worker; re-read before denying
+        role_cache.invalidate()
+        memberships = get_role_memberships(db)
+    check_role_membership(memberships, username, role)
 
 def check_role1_permission(db: Session, username: str):
-    if username != "role1":
-        raise HTTPException(status_code=403, detail="Permission denied: Only role1 can create tables and insert data")
+    check_role(db, username, "role1")
 
 def check_role2_permission(db: Session, username: str):
-    if username != "role2":
-        raise HTTPException(status_code=403, detail="Permission denied: Only role2 can view and delete tables")
+    check_role(db, username, "role2")
 
 def check_role3_permission(db: Session, username: str):
-    if username != "role3":
-        raise HTTPException(status_code=403, detail="Permission denied: Only role3 can update tables")
+    check_role(db, username, "role3")
 
 def create_table(db: Session, table_name: str, username: str):
     """Create a new table (role1 only)"""
@@ -76,103 +136,168 @@ def create_table(db: Session, table_name: str, username: str):
         raise HTTPException(status_code=400, detail="Table name must be between 1 and 63 characters")
     
     # Check if table already exists
-    check_query = text("""
-        SELECT EXISTS (
-            SELECT FROM information_schema.tables 
-            WHERE table_schema = 'public' 
-            AND table_name = :table_name
-        );
-    """)
-    exists = db.execute(check_query, {"table_name": table_name}).scalar()
-    
-    if exists:
+    if get_table_schema(db, table_name)["exists"]:
         raise HTTPException(status_code=400, detail=f"Table '{table_name}' already exists!")
 
     try:
-        # Use proper SQL quoting for table name
-        query = text(f"""
-            CREATE TABLE IF NOT EXISTS "{table_name}" (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(100) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                age INT NOT NULL
-            );
-        """)
-        db.execute(query)
+        db.execute(statement("create", table_name))
         db.commit()
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error creating table: {str(e)}")
+    finally:
+        schema_cache.invalidate(table_name)
+        response_cache.invalidate_table_list()
 
-def insert_data(db: Session, table_name: str, name: str, age: int, username: str):
-    """Insert data into a table (role1 only)"""
+def check_insert(db: Session, table_name: str, username: str):
+    """Check the user may insert into a table and get its (name, age) columns (role1 only)"""
     check_role1_permission(db, username)
 
-    # Check if table exists first
-    check_query = text("""
-        SELECT EXISTS (
-            SELECT FROM information_schema.tables 
-            WHERE table_schema = 'public' 
-            AND table_name = :table_name
-        );
-    """)
-    exists = db.execute(check_query, {"table_name": table_name}).scalar()
-    
-    if not exists:
-        raise HTTPException(status_code=404, detail=f"Table '{table_name}' does not exist. Please create the table first.")
+    # Resolve the table and its name/age columns (cached between calls)
+    return resolve_insert_columns(db, table_name)
 
-    # Get the current column names
-    columns = get_table_columns(db, table_name)
-    column_names = [col["column_name"] for col in columns]
-    
-    # Find the string column (name) and integer column (age)
-    string_columns = [col for col in columns if col["data_type"] in ["character varying", "text"]]
-    int_columns = [col for col in columns if col["data_type"] == "integer"]
-    
-    if not string_columns or not int_columns:
-        raise HTTPException(status_code=400, detail=f"Table '{table_name}' must have one string column and one integer column")
-    
-    name_column = string_columns[0]["column_name"]
-    age_column = int_columns[0]["column_name"]
+def insert_data(db: Session, table_name: str, name: str, age: int, username: str):
+    """Insert data into a table (role1 only)"""
+    name_column, age_column = check_insert(db, table_name, username)
 
     try:
-        # First check the actual column names in the table
-        query_columns = text(f"""
-            SELECT column_name, data_type 
-            FROM information_schema.columns 
-            WHERE table_name = :table_name;
-        """)
-        actual_columns = db.execute(query_columns, {"table_name": table_name}).fetchall()
-        actual_column_names = [col[0] for col in actual_columns]
-        
-        # Get the integer column that's not the id column
-        non_id_int_columns = [col for col in actual_columns 
-                             if col[1] == "integer" and col[0].lower() != "id"]
-        
-        if not non_id_int_columns:
-            raise HTTPException(status_code=400, detail=f"Table '{table_name}' must have an integer column other than 'id'")
-            
-        # Use the actual column names from the table
-        query = text(f"""
-            INSERT INTO "{table_name}" ("{name_column}", "{non_id_int_columns[0][0]}") 
-            VALUES (:{name_column}, :{non_id_int_columns[0][0]});
-        """)
-        
-        # Create a dictionary with the correct parameter names
-        params = {
-            name_column: name,
-            non_id_int_columns[0][0]: age
-        }
-        
-        db.execute(query, params)
+        query = statement("insert", table_name, name_column=name_column, age_column=age_column)
+        db.execute(query, {"name": name, "age": age})
         db.commit()
+        response_cache.invalidate_tables(table_name)
     except Exception as e:
         db.rollback()
+        # The cached layout may be stale if the table was altered elsewhere
+        schema_cache.invalidate(table_name)
         raise HTTPException(status_code=500, detail=f"Error inserting data into table '{table_name}': {str(e)}")
 
-def get_all_tables_info(db: Session, username: str):
-    """Get list of all tables (role2 only)"""
-    check_role2_permission(db, username)
+def insert_rows(db: Session, table_name: str, name_column: str, age_column: str, rows):
+    """Insert (name, age) rows with one statement and one commit"""
+    query = statement("insert_many", table_name, name_column=name_column, age_column=age_column)
+    db.execute(query, {"names": [row[0] for row in rows], "ages": [row[1] for row in rows]})
+    db.commit()
+    response_cache.invalidate_tables(table_name)
+
+def _iter_lines(chunks):
+    """Split an iterable of byte chunks into decoded text lines"""
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8")
+    if pending:
+        yield pending.decode("utf-8")
+
+def parse_bulk_rows(chunks, content_type: str):
+    """Yield rows from a JSON array, NDJSON or CSV (name,age header) request body"""
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type in ["application/x-ndjson", "application/ndjson", "application/jsonl"]:
+        for line in _iter_lines(chunks):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield line  # Rejected by row validation
+    elif media_type in ["text/csv", "application/csv"]:
+        yield from csv.DictReader(_iter_lines(chunks))
+    elif media_type in ["application/json", ""]:
+        try:
+            rows = json.loads(b"".join(chunks))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON body: {str(e)}")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="JSON body must be an array of rows")
+        yield from rows
+    else:
+        raise HTTPException(status_code=415, detail=f"Unsupported content type '{media_type}'. Use JSON, NDJSON or CSV")
+
+def _validate_bulk_row(row):
+    """Turn a parsed row into a (name, age) tuple, raising ValueError for bad rows"""
+    if not isinstance(row, dict) or "name" not in row or "age" not in row:
+        raise ValueError("Row must be an object with 'name' and 'age'")
+    name, age = row["name"], row["age"]
+    if not isinstance(name, str):
+        raise ValueError("'name' must be a string")
+    if len(name) > 100:
+        raise ValueError("'name' must be at most 100 characters")
+    if isinstance(age, bool) or isinstance(age, float):
+        raise ValueError("'age' must be an integer")
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        raise ValueError("'age' must be an integer")
+    return name, age
+
+def _copy_rows(db: Session, table_name: str, name_column: str, age_column: str, rows):
+    """Load rows through COPY FROM STDIN, falling back to a multi-row executemany"""
+    copy_sql = f"COPY {quote(table_name)} ({quote(name_column)}, {quote(age_column)}) FROM STDIN WITH (FORMAT csv)"
+    cursor = db.connection().connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):
+            # psycopg2
+            buffer = io.StringIO()
+            csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+            return "copy"
+        if hasattr(cursor, "copy"):
+            # psycopg 3
+            with cursor.copy(copy_sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+            return "copy"
+    finally:
+        cursor.close()
+
+    query = statement("insert", table_name, name_column=name_column, age_column=age_column)
+    db.execute(query, [{"name": name, "age": age} for name, age in rows])
+    return "executemany"
+
+def bulk_insert_data(db: Session, table_name: str, rows, username: str, chunk_size: int = BULK_INSERT_CHUNK_SIZE):
+    """Insert many rows into a table, committing every chunk_size rows (role1 only)"""
+    check_role1_permission(db, username)
+    name_column, age_column = resolve_insert_columns(db, table_name)
+
+    chunks = []
+    rejected = []
+    pending = []
+
+    def flush():
+        report = {"chunk": len(chunks), "rows": len(pending)}
+        try:
+            report["method"] = _copy_rows(db, table_name, name_column, age_column, pending)
+            db.commit()
+            response_cache.invalidate_tables(table_name)
+        except Exception as e:
+            db.rollback()
+            schema_cache.invalidate(table_name)
+            report["rows"] = 0
+            report["error"] = str(e)
+        chunks.append(report)
+        pending.clear()
+
+    for index, row in enumerate(rows):
+        try:
+            pending.append(_validate_bulk_row(row))
+        except ValueError as e:
+            rejected.append({"row": index, "error": str(e)})
+            continue
+        if len(pending) >= chunk_size:
+            flush()
+    if pending:
+        flush()
+
+    return {
+        "table_name": table_name,
+        "inserted": sum(chunk["rows"] for chunk in chunks),
+        "chunks": chunks,
+        "rejected": rejected,
+    }
+
+def list_public_tables(db: Session):
+    """Get name, schema and type of every table in the public schema"""
     query = text("""
         SELECT table_name, table_schema, table_type
         FROM information_schema.tables
@@ -181,55 +306,234 @@ def get_all_tables_info(db: Session, username: str):
     result = db.execute(query).fetchall()
     return [{"table_name": row[0], "table_schema": row[1], "table_type": row[2]} for row in result]
 
-def get_info_table(db: Session, table_name: str, username: str):
-    """Get table contents (role2 only)"""
+# Planner estimates and storage statistics for every table, in one catalog query.
+# reltuples is -1 until a table has been vacuumed or analyzed.
+TABLE_STATS_QUERY = text("""
+    SELECT t.table_name, t.table_schema, t.table_type,
+           CASE WHEN c.reltuples < 0 THEN NULL ELSE c.reltuples::BIGINT END AS estimated_rows,
+           pg_total_relation_size(c.oid) AS total_bytes,
+           c.relhasindex AS has_indexes,
+           GREATEST(s.last_vacuum, s.last_autovacuum) AS last_vacuum,
+           GREATEST(s.last_analyze, s.last_autoanalyze) AS last_analyze
+    FROM information_schema.tables t
+    JOIN pg_namespace n ON n.nspname = t.table_schema
+    JOIN pg_class c ON c.relnamespace = n.oid AND c.relname = t.table_name
+    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+    WHERE t.table_schema = 'public';
+""")
+
+def get_all_tables_info(db: Session, username: str, stats: bool = False, exact_counts: bool = False):
+    """Get list of all tables, optionally with size estimates and maintenance times (role2 only)"""
+    check_role2_permission(db, username)
+    if not stats:
+        return list_public_tables(db)
+
+    tables = [dict(row) for row in db.execute(TABLE_STATS_QUERY).mappings()]
+    if exact_counts:
+        # One full scan per table; only done when asked for
+        for table in tables:
+            table["row_count"] = db.execute(statement("count", table["table_name"])).scalar()
+    return tables
+
+def get_tables_snapshot(db: Session, username: str, table_names: List[str], rows: int = 20):
+    """Get the table list plus row count, columns and first rows of each requested table,
+    all from one consistent snapshot (role2 only)"""
+    check_role2_permission(db, username)
+
+    # The isolation level must be set by the first statement of the transaction
+    db.rollback()
+    try:
+        db.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;"))
+        tables = list_public_tables(db)
+        existing = {table["table_name"] for table in tables}
+
+        requested = [name for name in dict.fromkeys(table_names) if name in existing]
+        query_columns = text("""
+            SELECT table_name, column_name, data_type
+            FROM information_schema.columns
+            WHERE table_schema = 'public'
+            AND table_name = ANY(:table_names)
+            ORDER BY table_name, ordinal_position;
+        """)
+        columns = {}
+        for row in db.execute(query_columns, {"table_names": requested}).fetchall():
+            columns.setdefault(row[0], []).append({"column_name": row[1], "data_type": row[2]})
+
+        details = {}
+        for table_name in dict.fromkeys(table_names):
+            if table_name not in existing:
+                details[table_name] = {"error": f"Table '{table_name}' does not exist"}
+                continue
+            table_columns = columns.get(table_name, [])
+            ordered = any(col["column_name"] == "id" for col in table_columns)
+            row_count = db.execute(statement("count", table_name)).scalar()
+            query_rows = statement("select_first_ordered" if ordered else "select_first", table_name)
+            first_rows = db.execute(query_rows, {"rows": rows})
+            details[table_name] = {
+                "row_count": row_count,
+                "columns": table_columns,
+                "rows": rows_to_dicts(first_rows.keys(), first_rows.fetchall()),
+            }
+        return {"tables": tables, "details": details}
+    finally:
+        # Nothing to commit; end the read-only transaction
+        db.rollback()
+
+def get_info_table(db: Session, table_name: str, username: str, after_id: Optional[int] = None, limit: Optional[int] = None):
+    """Get table contents, optionally one keyset page ordered by id (role2 only)"""
     check_role2_permission(db, username)
     
     # Check if table exists
-    query_check = text("""
-        SELECT EXISTS (
-            SELECT 1 
-            FROM information_schema.tables 
-            WHERE table_name = :table_name
-        );
-    """)
-    table_exists = db.execute(query_check, {"table_name": table_name}).scalar()
-    
-    if not table_exists:
+    if not get_table_schema(db, table_name)["exists"]:
         raise HTTPException(status_code=404, detail=f"Table '{table_name}' does not exist")
     
-    # Use proper SQL quoting for the table name
-    query = text(f"""
-        SELECT * FROM "{table_name}";
-    """)
-    result = db.execute(query).fetchall()
-    return [dict(row._mapping) for row in result]
+    if after_id is None and limit is None:
+        # Use proper SQL quoting for the table name
+        result = db.execute(statement("select_all", table_name))
+        return rows_to_dicts(result.keys(), result.fetchall())
+
+    # Keyset pagination on the SERIAL primary key created by create_table
+    params = {"after_id": after_id if after_id is not None else 0, "limit": limit}
+    result = db.execute(statement("select_page", table_name), params)
+    return rows_to_dicts(result.keys(), result.fetchall())
+
+def stream_info_table(db: Session, table_name: str, username: str, batch_size: int = STREAM_BATCH_SIZE):
+    """Open a server-side cursor over table contents, yielding batches of rows (role2 only)"""
+    check_role2_permission(db, username)
+
+    if not get_table_schema(db, table_name)["exists"]:
+        raise HTTPException(status_code=404, detail=f"Table '{table_name}' does not exist")
+
+    query = statement("select_ordered", table_name)
+    result = db.execute(query.execution_options(yield_per=batch_size))
+    return result.mappings().partitions()
+
+def export_table(db: Session, table_name: str, username: str, batch_size: int = EXPORT_BATCH_SIZE):
+    """Open a server-side cursor over a table for export; returns its columns and batches of row tuples (role2 only)"""
+    check_role2_permission(db, username)
+
+    schema = get_table_schema(db, table_name)
+    if not schema["exists"]:
+        raise HTTPException(status_code=404, detail=f"Table '{table_name}' does not exist")
+
+    columns = schema["columns"]
+    column_names = tuple(col["column_name"] for col in columns)
+    operation = "select_columns_ordered" if "id" in column_names else "select_columns"
+    query = statement(operation, table_name, columns=column_names)
+    result = db.execute(query.execution_options(yield_per=batch_size))
+    return columns, result.partitions()
+
+def create_query_indexes(db: Session, table_name: str, name_column: str, age_column: str):
+    """Create the indexes used by age range and name prefix queries, without blocking writers"""
+    indexes = [
+        ("create_index", f"{table_name}_{age_column}_idx"[:63], age_column),
+        ("create_prefix_index", f"{table_name}_{name_column}_prefix_idx"[:63], name_column),
+    ]
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with db.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for operation, index_name, column in indexes:
+            connection.execute(statement(operation, table_name, index=index_name, column=column))
+    return [index_name for _, index_name, _ in indexes]
+
+def build_table_query(request: QueryTableRequest, table_name: str, columns: dict):
+    """SQL and parameters of a query_table request; `columns` maps logical to actual column names"""
+    conditions = []
+    params = {}
+    age = quote_text(columns["age"])
+    if request.min_age is not None:
+        conditions.append(f"{age} >= :min_age")
+        params["min_age"] = request.min_age
+    if request.max_age is not None:
+        conditions.append(f"{age} <= :max_age")
+        params["max_age"] = request.max_age
+    if request.name_prefix:
+        # Backslash is LIKE's default escape character
+        conditions.append(f"{quote_text(columns['name'])} LIKE :name_prefix")
+        escaped = request.name_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params["name_prefix"] = escaped + "%"
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    direction = "DESC" if request.descending else "ASC"
+    aggregates = request.aggregates or (["count"] if request.group_by else [])
+    if aggregates:
+        functions = {
+            "count": "COUNT(*)",
+            "avg": f"AVG({age})",
+            "min": f"MIN({age})",
+            "max": f"MAX({age})",
+        }
+        select = [f"{functions[name]} AS {name}" for name in dict.fromkeys(aggregates)]
+        group = ""
+        order = ""
+        if request.group_by:
+            select.insert(0, f"{quote_text(columns[request.group_by])} AS {request.group_by}")
+            group = f"GROUP BY {quote_text(columns[request.group_by])}"
+            order_key = request.order_by or request.group_by
+            if order_key not in aggregates and order_key != request.group_by:
+                raise HTTPException(status_code=400, detail=f"Cannot order groups by '{order_key}'")
+            order = f"ORDER BY {order_key} {direction}"
+        parts = [f'SELECT {", ".join(select)} FROM {quote_text(table_name)}', where, group, order]
+    else:
+        order_key = request.order_by or "id"
+        if order_key not in columns:
+            raise HTTPException(status_code=400, detail=f"Cannot order rows by '{order_key}'")
+        parts = [f"SELECT * FROM {quote_text(table_name)}", where, f"ORDER BY {quote_text(columns[order_key])} {direction}"]
+
+    if request.limit is not None:
+        parts.append("LIMIT :limit")
+        params["limit"] = request.limit
+    return " ".join(part for part in parts if part) + ";", params
+
+def query_table(db: Session, request: QueryTableRequest, username: str):
+    """Filter, order and aggregate a name/age table in the database (role2 only)"""
+    check_role2_permission(db, username)
+    table_name = request.table_name
+    schema = get_table_schema(db, table_name)
+    if not schema["exists"]:
+        raise HTTPException(status_code=404, detail=f"Table '{table_name}' does not exist")
+    name_column, age_column = insert_columns_from_schema(schema, table_name)
+
+    # Logical column names map to the table's actual (possibly renamed) columns
+    column_names = [col["column_name"] for col in schema["columns"]]
+    columns = {"name": name_column, "age": age_column}
+    for column in ["id", "created_at"]:
+        if column in column_names:
+            columns[column] = column
+    query, params = build_table_query(request, table_name, columns)
+
+    indexes = []
+    if request.create_indexes:
+        try:
+            indexes = create_query_indexes(db, table_name, name_column, age_column)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error creating indexes: {str(e)}")
+
+    try:
+        result = db.execute(text(query), params).fetchall()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error querying table '{table_name}': {str(e)}")
+    return {"rows": [dict(row._mapping) for row in result], "indexes": indexes}
 
 def delete_table_endpoint(db: Session, table_name: str, username: str):
     """Delete a table (role2 only)"""
     check_role2_permission(db, username)
     
     # Check if table exists first
-    check_query = text("""
-        SELECT EXISTS (
-            SELECT FROM information_schema.tables 
-            WHERE table_schema = 'public' 
-            AND table_name = :table_name
-        );
-    """)
-    exists = db.execute(check_query, {"table_name": table_name}).scalar()
-    
-    if not exists:
+    if not get_table_schema(db, table_name)["exists"]:
         raise HTTPException(status_code=404, detail=f"Table '{table_name}' does not exist")
     
     try:
-        query = text(f"""DROP TABLE IF EXISTS "{table_name}";""")
-        db.execute(query)
+        db.execute(statement("drop", table_name))
         db.commit()
         return f"Table '{table_name}' deleted successfully"
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error deleting table: {str(e)}")
+    finally:
+        schema_cache.invalidate(table_name)
+        response_cache.invalidate_tables(table_name)
+        response_cache.invalidate_table_list()
 
 def get_table_columns(db: Session, table_name: str):
     """Get all columns in a table"""
@@ -241,6 +545,73 @@ def get_table_columns(db: Session, table_name: str):
     result = db.execute(query, {"table_name": table_name}).all()
     return [{"column_name": row[0], "data_type": row[1]} for row in result]
 
+# One catalog round-trip: no rows means the table does not exist
+TABLE_SCHEMA_QUERY = text("""
+    SELECT c.column_name, c.data_type
+    FROM information_schema.tables t
+    LEFT JOIN information_schema.columns c
+        ON c.table_schema = t.table_schema AND c.table_name = t.table_name
+    WHERE t.table_schema = 'public'
+    AND t.table_name = :table_name
+    ORDER BY c.ordinal_position;
+""")
+
+def build_table_schema(rows):
+    """Build the cached schema entry from the rows of TABLE_SCHEMA_QUERY"""
+    columns = [{"column_name": row[0], "data_type": row[1]} for row in rows if row[0] is not None]
+
+    # The name column is the first string column, the age column the first integer column besides 'id'
+    string_columns = [col["column_name"] for col in columns if col["data_type"] in ["character varying", "text"]]
+    int_columns = [col["column_name"] for col in columns
+                   if col["data_type"] == "integer" and col["column_name"].lower() != "id"]
+
+    return {
+        "exists": bool(rows),
+        "columns": columns,
+        "name_column": string_columns[0] if string_columns else None,
+        "age_column": int_columns[0] if int_columns else None,
+    }
+
+def get_table_schema(db: Session, table_name: str):
+    """Get table existence and column layout, served from the schema cache when possible"""
+    schema = schema_cache.get(table_name)
+    if schema is None:
+        rows = db.execute(TABLE_SCHEMA_QUERY, {"table_name": table_name}).all()
+        schema = build_table_schema(rows)
+        # A lagging replica or another worker may not reflect a table that was just created; never cache that
+        if schema["exists"] or not (is_replica_session(db) or WEB_WORKERS > 1):
+            schema_cache.set(table_name, schema)
+    return schema
+
+def load_table_schemas(db: Session):
+    """Fill the schema cache with the layout of every public table in one catalog query"""
+    query = text("""
+        SELECT t.table_name, c.column_name, c.data_type
+        FROM information_schema.tables t
+        LEFT JOIN information_schema.columns c
+            ON c.table_schema = t.table_schema AND c.table_name = t.table_name
+        WHERE t.table_schema = 'public'
+        ORDER BY t.table_name, c.ordinal_position;
+    """)
+    rows_by_table = {}
+    for row in db.execute(query).all():
+        rows_by_table.setdefault(row[0], []).append(row[1:])
+    for table_name, rows in rows_by_table.items():
+        schema_cache.set(table_name, build_table_schema(rows))
+    return len(rows_by_table)
+
+def resolve_insert_columns(db: Session, table_name: str):
+    """Get the (name, age) column pair that rows are inserted into"""
+    return insert_columns_from_schema(get_table_schema(db, table_name), table_name)
+
+def insert_columns_from_schema(schema, table_name: str):
+    """Pick the (name, age) column pair out of a schema entry"""
+    if not schema["exists"]:
+        raise HTTPException(status_code=404, detail=f"Table '{table_name}' does not exist. Please create the table first.")
+    if not schema["name_column"] or not schema["age_column"]:
+        raise HTTPException(status_code=400, detail=f"Table '{table_name}' must have one string column and one integer column other than 'id'")
+    return schema["name_column"], schema["age_column"]
+
 def update_table_info(db: Session, update_table_request: UpdateTableRequest, username: str):
     """Update table structure (role3 only)"""
     check_role3_permission(db, username)
@@ -254,28 +625,24 @@ def update_table_info(db: Session, update_table_request: UpdateTableRequest, use
         raise HTTPException(status_code=400, detail="Invalid column name. Column names must be valid SQL identifiers.")
 
     # Check if new table name exists
-    if new_table_name:
-        query_check = text("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = :new_table_name);")
-        exists = db.execute(query_check, {"new_table_name": new_table_name}).scalar()
-        
-        if exists:
-            raise HTTPException(status_code=400, detail="Table with the new name already exists")
+    if new_table_name and get_table_schema(db, new_table_name)["exists"]:
+        raise HTTPException(status_code=400, detail="Table with the new name already exists")
 
     # Check if source table exists
-    query_check_source = text("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = :table_name);")
-    source_exists = db.execute(query_check_source, {"table_name": table_name}).scalar()
-    if not source_exists:
+    if not get_table_schema(db, table_name)["exists"]:
         raise HTTPException(status_code=404, detail=f"Source table '{table_name}' does not exist")
 
+    batched = new_age is not None and update_table_request.batch_size is not None
+    if batched:
+        ensure_jobs_table(db)
+
     try:
         changes = []
+        job_id = None
         
         # Rename table if requested
         if new_table_name:
-            query = text(f"""
-                ALTER TABLE "{table_name}" RENAME TO "{new_table_name}";
-            """)
-            db.execute(query)
+            db.execute(statement("rename_table", table_name, new_table=new_table_name))
             changes.append(f"Table '{table_name}' renamed to '{new_table_name}'")
             # Update table_name for subsequent operations
             table_name = new_table_name
@@ -299,45 +666,41 @@ def update_table_info(db: Session, update_table_request: UpdateTableRequest, use
             # If we don't find the exact 'name' column, try to rename the first string column
             if "name" not in column_names:
                 old_name = string_columns[0]
-                query_name = text(f"""
-                    ALTER TABLE "{table_name}" RENAME COLUMN "{old_name}" TO "{new_name}";
-                """)
-                db.execute(query_name)
+                db.execute(statement("rename_column", table_name, column=old_name, new_column=new_name))
                 changes.append(f"Column '{old_name}' renamed to '{new_name}'")
             else:
-                query_name = text(f"""
-                    ALTER TABLE "{table_name}" RENAME COLUMN name TO "{new_name}";
-                """)
-                db.execute(query_name)
+                db.execute(statement("rename_column", table_name, column="name", new_column=new_name))
                 changes.append(f"Column 'name' renamed to '{new_name}'")
 
         # Update age values if requested (not renaming the column)
         if new_age is not None:
             # Check if the age column exists
-            query_check_age = text("""
-                SELECT EXISTS (
-                    SELECT 1 
-                    FROM information_schema.columns 
-                    WHERE table_name = :table_name 
-                    AND column_name = 'age'
-                );
-            """)
-            age_exists = db.execute(query_check_age, {"table_name": table_name}).scalar()
-            
-            if not age_exists:
+            if "age" not in column_names:
                 raise HTTPException(status_code=404, detail=f"Column 'age' does not exist in table '{table_name}'")
 
-            query_age = text(f"""
-                UPDATE "{table_name}" SET age = :new_age;
-            """)
-            db.execute(query_age, {"new_age": new_age})
-            changes.append(f"Updated all ages to {new_age}")
+            if batched:
+                # Rows up to the current max id are updated batch by batch after this commit
+                max_id = db.execute(statement("max_id", table_name)).scalar()
+                params = {"new_age": new_age, "batch_size": update_table_request.batch_size}
+                job_id = create_job(db, "update_age", table_name, username, params, max_id)
+                changes.append(f"Scheduled job {job_id} to update all ages to {new_age}")
+            else:
+                db.execute(statement("update_age", table_name), {"new_age": new_age})
+                changes.append(f"Updated all ages to {new_age}")
 
         db.commit()
-        return {
+        result = {
             "message": "Changes applied successfully!",
             "changes": changes
         }
+        if job_id is not None:
+            result["job_id"] = job_id
+        return result
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    finally:
+        schema_cache.invalidate(update_table_request.table_name, new_table_name)
+        response_cache.invalidate_tables(update_table_request.table_name, new_table_name)
+        if new_table_name:
+            response_cache.invalidate_table_list()
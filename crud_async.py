@@ -0,0 +1,127 @@
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text
+from fastapi import HTTPException
+from cache import WEB_WORKERS, schema_cache, role_cache, response_cache
+from statements import statement
+from crud import (
+    TABLE_SCHEMA_QUERY, build_table_schema, insert_columns_from_schema,
+    ROLE_MEMBERSHIP_QUERY, build_role_memberships, check_role_membership, is_member
+)
+
+# Async counterparts of the hot paths in crud.py, served on the asyncpg engine.
+# They share the schema, role and response caches with the sync functions, so
+# invalidations from either side are visible to both.
+
+async def get_table_schema(db: AsyncSession, table_name: str):
+    """Get table existence and column layout, served from the schema cache when possible"""
+    schema = schema_cache.get(table_name)
+    if schema is None:
+        result = await db.execute(TABLE_SCHEMA_QUERY, {"table_name": table_name})
+        schema = build_table_schema(result.all())
+        # Another worker may have just created a missing table
+        if schema["exists"] or WEB_WORKERS == 1:
+            schema_cache.set(table_name, schema)
+    return schema
+
+async def get_role_memberships(db: AsyncSession):
+    """Get the role membership map, served from the role cache when possible"""
+    memberships = role_cache.get("memberships")
+    if memberships is None:
+        result = await db.execute(ROLE_MEMBERSHIP_QUERY)
+        memberships = build_role_memberships(result.all())
+        role_cache.set("memberships", memberships)
+    return memberships
+
+async def check_role(db: AsyncSession, username: str, role: str):
+    memberships = await get_role_memberships(db)
+    if WEB_WORKERS > 1 and not is_member(memberships, username, role):
+        # The user may have just been created or granted on another worker; re-read before denying
+        role_cache.invalidate()
+        memberships = await get_role_memberships(db)
+    check_role_membership(memberships, username, role)
+
+async def check_role1_permission(db: AsyncSession, username: str):
+    await check_role(db, username, "role1")
+
+async def check_role2_permission(db: AsyncSession, username: str):
+    await check_role(db, username, "role2")
+
+async def create_table(db: AsyncSession, table_name: str, username: str):
+    """Create a new table (role1 only)"""
+    await check_role1_permission(db, username)
+
+    if not table_name or len(table_name) < 1 or len(table_name) > 63:
+        raise HTTPException(status_code=400, detail="Table name must be between 1 and 63 characters")
+
+    if (await get_table_schema(db, table_name))["exists"]:
+        raise HTTPException(status_code=400, detail=f"Table '{table_name}' already exists!")
+
+    try:
+        await db.execute(statement("create", table_name))
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error creating table: {str(e)}")
+    finally:
+        schema_cache.invalidate(table_name)
+        await response_cache.invalidate_async(table_list=True)
+
+async def insert_data(db: AsyncSession, table_name: str, name: str, age: int, username: str):
+    """Insert data into a table (role1 only)"""
+    await check_role1_permission(db, username)
+    name_column, age_column = insert_columns_from_schema(await get_table_schema(db, table_name), table_name)
+
+    try:
+        query = statement("insert", table_name, name_column=name_column, age_column=age_column)
+        await db.execute(query, {"name": name, "age": age})
+        await db.commit()
+        await response_cache.invalidate_async(table_name)
+    except Exception as e:
+        await db.rollback()
+        schema_cache.invalidate(table_name)
+        raise HTTPException(status_code=500, detail=f"Error inserting data into table '{table_name}': {str(e)}")
+
+async def get_all_tables_info(db: AsyncSession, username: str):
+    """Get list of all tables (role2 only)"""
+    await check_role2_permission(db, username)
+    query = text("""
+        SELECT table_name, table_schema, table_type
+        FROM information_schema.tables
+        WHERE table_schema = 'public';
+    """)
+    result = (await db.execute(query)).fetchall()
+    return [{"table_name": row[0], "table_schema": row[1], "table_type": row[2]} for row in result]
+
+async def get_info_table(db: AsyncSession, table_name: str, username: str, after_id: Optional[int] = None, limit: Optional[int] = None):
+    """Get table contents, optionally one keyset page ordered by id (role2 only)"""
+    await check_role2_permission(db, username)
+
+    if not (await get_table_schema(db, table_name))["exists"]:
+        raise HTTPException(status_code=404, detail=f"Table '{table_name}' does not exist")
+
+    if after_id is None and limit is None:
+        result = (await db.execute(statement("select_all", table_name))).fetchall()
+        return [dict(row._mapping) for row in result]
+
+    params = {"after_id": after_id if after_id is not None else 0, "limit": limit}
+    result = (await db.execute(statement("select_page", table_name), params)).fetchall()
+    return [dict(row._mapping) for row in result]
+
+async def delete_table_endpoint(db: AsyncSession, table_name: str, username: str):
+    """Delete a table (role2 only)"""
+    await check_role2_permission(db, username)
+
+    if not (await get_table_schema(db, table_name))["exists"]:
+        raise HTTPException(status_code=404, detail=f"Table '{table_name}' does not exist")
+
+    try:
+        await db.execute(statement("drop", table_name))
+        await db.commit()
+        return f"Table '{table_name}' deleted successfully"
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error deleting table: {str(e)}")
+    finally:
+        schema_cache.invalidate(table_name)
+        await response_cache.invalidate_async(table_name, table_list=True)
@@ -1,25 +1,323 @@
-from sqlalchemy import create_engine
+import itertools
+import logging
+import os
+import threading
+import time
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from sqlalchemy import text
+from fastapi import HTTPException, Request
+from metrics import PoolMetrics, current_query_stats, compact_sql
 
 
 # chgidem xi senc cher ashxatum
 # DATABASE_URL = "postgresql://postgres:@192.168.150.234:5432/new_db"
-DATABASE_URL = "postgresql://postgres:@localhost:5432/new_db"
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:@localhost:5432/new_db")
 
-engine = create_engine(DATABASE_URL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() in ["1", "true", "yes"]
+# Milliseconds, 0 disables the limit
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "0"))
+# Server-side prepared statements: asyncpg keeps this many per connection (0 disables,
+# e.g. behind pgbouncer); psycopg 3 prepares a statement once it ran this many times
+# on a connection (-1 disables). psycopg2 has no server-side prepare.
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", "100"))
+DB_PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", "5"))
+# Statements slower than this many milliseconds are logged, 0 disables the log
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+
+# Comma-separated read replicas of DATABASE_URL; read-only routes are spread over them
+REPLICA_URLS = [url.strip() for url in os.getenv("REPLICA_URLS", "").split(",") if url.strip()]
+# Replicas further behind the primary than this many seconds are skipped
+REPLICA_MAX_LAG_S = float(os.getenv("REPLICA_MAX_LAG_S", "5"))
+REPLICA_CHECK_INTERVAL_S = float(os.getenv("REPLICA_CHECK_INTERVAL_S", "5"))
+REPLICA_CONNECT_TIMEOUT = int(os.getenv("REPLICA_CONNECT_TIMEOUT", "2"))
+# After a commit the client gets the commit time back (cookie and header) for this
+# many seconds; its reads skip replicas that have not replayed up to it. 0 disables
+READ_YOUR_WRITES_S = float(os.getenv("READ_YOUR_WRITES_S", "5"))
+LAST_WRITE_COOKIE = "daniam_last_write"
+LAST_WRITE_HEADER = "x-daniam-last-write"
+
+logger = logging.getLogger(__name__)
+
+
+class _TimedCheckout:
+    """Pool mixin that records how long each checkout takes and whether it had to wait"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        # With no idle connection and no overflow left, the checkout blocks until one is returned
+        waited = self.checkedin() == 0 and self._max_overflow > -1 and self.overflow() >= self._max_overflow
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.metrics.record_checkout((time.perf_counter() - start) * 1000, waited, timed_out)
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def _pool_options():
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def _count_connects(engine):
+    pool_engine = getattr(engine, "sync_engine", engine)
+    event.listen(pool_engine, "connect", lambda dbapi_connection, record: pool_engine.pool.metrics.record_connect())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["query_start"].pop()) * 1000
+    query_stats = current_query_stats.get()
+    if query_stats is not None:
+        query_stats.record(statement, elapsed_ms)
+    if SLOW_QUERY_MS and elapsed_ms >= SLOW_QUERY_MS:
+        logger.warning("Slow query (%.1f ms): %s", elapsed_ms, compact_sql(statement))
+
+
+def _handle_error(context):
+    # after_cursor_execute does not fire for a failed statement, e.g. one cancelled by
+    # statement_timeout or lock_timeout; errors raised before the cursor ran have no start time
+    starts = context.connection.info.get("query_start") if context.connection is not None else None
+    if not starts or context.statement is None:
+        return
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+    query_stats = current_query_stats.get()
+    if query_stats is not None:
+        query_stats.record(context.statement, elapsed_ms, failed=True)
+    if SLOW_QUERY_MS and elapsed_ms >= SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query failed (%.1f ms, %s): %s",
+            elapsed_ms, type(context.original_exception).__name__, compact_sql(context.statement),
+        )
+
+
+def _instrument_queries(engine):
+    """Time every statement for the per-request stats and the slow-query log"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+sync_connect_args = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"} if DB_STATEMENT_TIMEOUT else {}
+if make_url(DATABASE_URL).drivername == "postgresql+psycopg":
+    sync_connect_args["prepare_threshold"] = DB_PREPARE_THRESHOLD if DB_PREPARE_THRESHOLD >= 0 else None
+engine = create_engine(DATABASE_URL, poolclass=InstrumentedQueuePool, connect_args=sync_connect_args, **_pool_options())
+_count_connects(engine)
+_instrument_queries(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Same database through asyncpg, for the /async routes
+# Derived from the parsed URL so an explicit sync driver (postgresql+psycopg2://...) is swapped too
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or make_url(DATABASE_URL).set(drivername="postgresql+asyncpg")
+_async_url = make_url(ASYNC_DATABASE_URL)
+if _async_url.drivername == "postgresql+asyncpg" and "prepared_statement_cache_size" not in _async_url.query:
+    _async_url = _async_url.update_query_dict({"prepared_statement_cache_size": str(DB_PREPARED_STATEMENT_CACHE_SIZE)})
+
+try:
+    asyncpg_args = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT)}} if DB_STATEMENT_TIMEOUT else {}
+    async_engine = create_async_engine(
+        _async_url, poolclass=InstrumentedAsyncQueuePool, connect_args=asyncpg_args, **_pool_options()
+    )
+    _count_connects(async_engine)
+    _instrument_queries(async_engine)
+except ImportError:
+    # asyncpg is optional; without it only the sync routes are served
+    async_engine = None
+except (exc.ArgumentError, exc.InvalidRequestError) as e:
+    # ASYNC_DATABASE_URL names a driver that is not asyncio-capable
+    logger.warning("Async routes disabled, cannot use %s: %s", _async_url.drivername, e)
+    async_engine = None
+
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+# Lag of a replica in seconds: zero once it has replayed everything it received,
+# and always zero when the server is not in recovery at all
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END;
+""")
+
+
+class Replica:
+    """A read replica with its own pool and the outcome of its last health check"""
+
+    def __init__(self, url: str):
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self.engine = create_engine(
+            url,
+            poolclass=InstrumentedQueuePool,
+            connect_args={**sync_connect_args, "connect_timeout": REPLICA_CONNECT_TIMEOUT},
+            **_pool_options(),
+        )
+        _count_connects(self.engine)
+        _instrument_queries(self.engine)
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=self.engine, info={"replica": self.name})
+        self.healthy = False
+        self.lag_s = None
+        # Wall-clock time up to which the replica had replayed the primary at its last check
+        self.replayed_at = None
+        self.error = None
+        self.checked_at = None
+        self._lock = threading.Lock()
+
+    def check(self):
+        try:
+            with self.engine.connect() as connection:
+                self.lag_s = float(connection.execute(REPLICA_LAG_QUERY).scalar())
+            self.replayed_at = time.time() - self.lag_s
+            self.healthy = True
+            self.error = None
+        except Exception as e:
+            if self.healthy or self.checked_at is None:
+                logger.warning("Replica %s is unavailable: %s", self.name, e)
+            self.healthy = False
+            self.error = str(e)
+        self.checked_at = time.monotonic()
+
+    def usable(self):
+        """Whether reads may go here, re-checking the replica when the last check is stale"""
+        if self.checked_at is None or time.monotonic() - self.checked_at >= REPLICA_CHECK_INTERVAL_S:
+            # One request re-checks; concurrent ones go by the previous result
+            if self._lock.acquire(blocking=False):
+                try:
+                    self.check()
+                finally:
+                    self._lock.release()
+        return self.healthy and self.lag_s is not None and self.lag_s <= REPLICA_MAX_LAG_S
+
+    def has_replayed(self, commit_time: float):
+        return self.replayed_at is not None and self.replayed_at >= commit_time
+
+
+replicas = [Replica(url) for url in REPLICA_URLS]
+_replica_turn = itertools.count()
+
+def remember_write(request_state):
+    """Note a commit on the primary so the response hands its time back to the client"""
+    if request_state is not None and READ_YOUR_WRITES_S:
+        request_state.last_write = time.time()
+
+
+def _remember_writer(session):
+    remember_write(session.info.get("request_state"))
+
+
+event.listen(SessionLocal, "after_commit", _remember_writer)
+
+
+def last_write(request: Request):
+    """Commit time the client sent back from its latest write, if it is still within READ_YOUR_WRITES_S"""
+    value = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE)
+    try:
+        commit_time = float(value)
+    except (TypeError, ValueError):
+        return None
+    return commit_time if time.time() - commit_time <= READ_YOUR_WRITES_S else None
+
+
+def read_session(last_write: float = None):
+    """Session for read-only work: the next usable replica in turn that has replayed the client's last write, else the primary"""
+    if replicas:
+        start = next(_replica_turn)
+        for i in range(len(replicas)):
+            replica = replicas[(start + i) % len(replicas)]
+            if replica.usable() and (last_write is None or replica.has_replayed(last_write)):
+                return replica.session_factory()
+    return SessionLocal()
+
+
+def is_replica_session(db):
+    return "replica" in db.info
+
+
 Base = declarative_base()
 
-def get_db():
+def get_db(request: Request):
     db = SessionLocal()
+    # Commits made through this session are handed back to the client for read-your-writes
+    db.info["request_state"] = request.state
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db(request: Request):
+    """Session for read-only routes, served by a replica when one is healthy and caught up"""
+    db = read_session(last_write(request))
     try:
         yield db
     finally:
         db.close()
 
+def _pool_stats(pool):
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": pool._max_overflow,
+        "timeout": pool.timeout(),
+        **pool.metrics.snapshot(),
+    }
+
+def pool_stats():
+    """Live statistics for the sync pool and, when available, the async pool"""
+    stats = {"sync": _pool_stats(engine.pool)}
+    if async_engine is not None:
+        stats["async"] = _pool_stats(async_engine.pool)
+    if replicas:
+        stats["replicas"] = {
+            replica.name: {
+                "healthy": replica.healthy,
+                "lag_s": replica.lag_s,
+                "error": replica.error,
+                **_pool_stats(replica.engine.pool),
+            }
+            for replica in replicas
+        }
+    return stats
+
+async def get_async_db():
+    if async_engine is None:
+        raise HTTPException(status_code=503, detail="Async database access requires the asyncpg driver")
+    async with AsyncSessionLocal() as db:
+        yield db
+
 # def reset_database():
 #     try:
 #         db = SessionLocal()
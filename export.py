@@ -0,0 +1,189 @@
+import csv
+import io
+import re
+import zlib
+from urllib.parse import quote
+from fastapi import HTTPException
+from serialization import dumps
+
+# Encoders for /export_table. Each takes the column layout from crud.export_table
+# and its batches of row tuples, and yields compressed bytes one batch at a time,
+# so memory stays bounded by the batch size whatever the table size.
+
+FORMATS = {
+    # format: (media type, file extension)
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+COMPRESSIONS = {"none": None, "gzip": "gz", "zstd": "zst"}
+
+# PostgreSQL data types of create_table's columns and their Arrow counterparts;
+# anything else is exported as a string
+ARROW_TYPES = {
+    "integer": "int32",
+    "bigint": "int64",
+    "smallint": "int16",
+    "boolean": "bool_",
+    "double precision": "float64",
+    "real": "float32",
+    "character varying": "string",
+    "text": "string",
+    "date": "date32",
+}
+
+
+def _require(module: str):
+    try:
+        return __import__(module)
+    except ImportError:
+        raise HTTPException(status_code=501, detail=f"This export needs the optional '{module}' package")
+
+
+def check_export(format: str, compression: str):
+    """Fail before streaming starts when a format or codec cannot be produced"""
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format '{format}'")
+    if compression not in COMPRESSIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported compression '{compression}'")
+    if format in ("arrow", "parquet"):
+        _require("pyarrow")
+    elif compression == "zstd":
+        _require("zstandard")
+
+
+def export_media(table_name: str, format: str, compression: str):
+    """Media type and download file name of an export"""
+    media_type, extension = FORMATS[format]
+    filename = f"{table_name}.{extension}"
+    if _wrapped(format, compression):
+        media_type = "application/gzip" if compression == "gzip" else "application/zstd"
+        filename += "." + COMPRESSIONS[compression]
+    return media_type, filename
+
+
+def content_disposition(filename: str):
+    """Attachment header safe for any table name: an ASCII fallback plus the RFC 5987 UTF-8 name"""
+    fallback = re.sub(r"[^A-Za-z0-9._-]", "_", filename)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+def _wrapped(format: str, compression: str):
+    """Whether the whole file goes through the codec; Parquet and zstd Arrow compress internally"""
+    if compression == "none" or format == "parquet":
+        return False
+    return format != "arrow" or compression == "gzip"
+
+
+def _compressor(compression: str):
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if compression == "zstd":
+        return _require("zstandard").ZstdCompressor().compressobj()
+    return None
+
+
+def _encode_text(columns, batches, format: str):
+    names = [col["column_name"] for col in columns]
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # The header goes out on its own, so an empty table still exports it
+        writer.writerow(names)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        for batch in batches:
+            writer.writerows(batch)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    else:
+        for batch in batches:
+            yield b"".join(dumps(dict(zip(names, row))) + b"\n" for row in batch)
+
+
+def _arrow_schema(pa, columns):
+    fields = []
+    for col in columns:
+        data_type = col["data_type"]
+        if data_type.startswith("timestamp"):
+            arrow_type = pa.timestamp("us", tz="UTC" if "with time zone" in data_type else None)
+        else:
+            arrow_type = getattr(pa, ARROW_TYPES.get(data_type, "string"))()
+        fields.append(pa.field(col["column_name"], arrow_type))
+    return pa.schema(fields)
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands what was written back to the generator"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _encode_columnar(columns, batches, format: str, compression: str):
+    pa = _require("pyarrow")
+    schema = _arrow_schema(pa, columns)
+    string_columns = [i for i, field in enumerate(schema) if pa.types.is_string(field.type)]
+    sink = _Sink()
+    if format == "parquet":
+        import pyarrow.parquet as pq
+
+        writer = pq.ParquetWriter(sink, schema, compression=compression)
+        write = writer.write_table
+    else:
+        ipc_codec = "zstd" if compression == "zstd" else None
+        writer = pa.ipc.new_stream(sink, schema, options=pa.ipc.IpcWriteOptions(compression=ipc_codec))
+        write = writer.write_batch
+    try:
+        for batch in batches:
+            # Transpose the row tuples into columns; string columns take the text of other types
+            arrays = [list(values) for values in zip(*batch)]
+            for i in string_columns:
+                arrays[i] = [None if value is None else str(value) for value in arrays[i]]
+            record_batch = pa.RecordBatch.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(arrays, schema)], schema=schema
+            )
+            write(pa.Table.from_batches([record_batch]) if format == "parquet" else record_batch)
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def encode_export(columns, batches, format: str, compression: str):
+    """Yield the export file chunk by chunk"""
+    if format in ("arrow", "parquet"):
+        chunks = _encode_columnar(columns, batches, format, compression)
+    else:
+        chunks = _encode_text(columns, batches, format)
+
+    compressor = _compressor(compression) if _wrapped(format, compression) else None
+    for chunk in chunks:
+        if compressor is None:
+            yield chunk
+        else:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+    if compressor is not None:
+        yield compressor.flush()
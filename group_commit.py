@@ -0,0 +1,132 @@
+import asyncio
+import contextvars
+import os
+import threading
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from cache import schema_cache
+from crud import insert_rows
+from database import SessionLocal
+
+# Opt-in group commit for /insert_data: concurrent single-row inserts into the same
+# table are buffered and committed together, so one WAL flush covers the whole batch
+GROUP_COMMIT = os.getenv("GROUP_COMMIT", "false").lower() in ["1", "true", "yes"]
+# A batch is committed once it holds this many rows or its first row has waited this long
+GROUP_COMMIT_MAX_ROWS = int(os.getenv("GROUP_COMMIT_MAX_ROWS", "500"))
+GROUP_COMMIT_MAX_WAIT_MS = float(os.getenv("GROUP_COMMIT_MAX_WAIT_MS", "5"))
+
+
+class _Batch:
+    """Rows waiting to be committed together into one table"""
+
+    def __init__(self):
+        self.rows = []
+        self.futures = []
+        self.full = asyncio.Event()
+
+
+def _commit_batch(table_name: str, name_column: str, age_column: str, rows):
+    """Commit rows in one transaction, falling back to one transaction per row so a bad row fails alone.
+
+    Returns one error per row, None where the row was committed.
+    """
+    db = SessionLocal()
+    try:
+        try:
+            insert_rows(db, table_name, name_column, age_column, rows)
+            return [None] * len(rows)
+        except Exception as e:
+            db.rollback()
+            if len(rows) == 1:
+                return [e]
+
+        errors = []
+        for row in rows:
+            try:
+                insert_rows(db, table_name, name_column, age_column, [row])
+                errors.append(None)
+            except Exception as e:
+                db.rollback()
+                errors.append(e)
+        return errors
+    finally:
+        db.close()
+
+
+class GroupCommitter:
+    """Per-table insert buffers, each flushed as one multi-row INSERT by a background task"""
+
+    def __init__(self, max_rows: int, max_wait_ms: float):
+        self.max_rows = max_rows
+        self.max_wait_ms = max_wait_ms
+        self.batches = 0
+        self.rows = 0
+        self.failed_rows = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    async def insert(self, table_name: str, name_column: str, age_column: str, name: str, age: int):
+        """Queue one row and return once the batch holding it is committed"""
+        loop = asyncio.get_running_loop()
+        key = (table_name, name_column, age_column)
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _Batch()
+            # The flush serves many requests, so it does not run in the context of the first one
+            loop.create_task(self._flush(key, batch), context=contextvars.Context())
+
+        future = loop.create_future()
+        batch.rows.append((name, age))
+        batch.futures.append(future)
+        if len(batch.rows) >= self.max_rows:
+            # Later rows start the next batch while this one commits
+            del self._pending[key]
+            batch.full.set()
+        await future
+
+    async def _flush(self, key, batch: _Batch):
+        try:
+            await asyncio.wait_for(batch.full.wait(), self.max_wait_ms / 1000)
+        except asyncio.TimeoutError:
+            pass
+        if self._pending.get(key) is batch:
+            del self._pending[key]
+
+        table_name = key[0]
+        try:
+            errors = await run_in_threadpool(_commit_batch, *key, batch.rows)
+        except Exception as e:
+            errors = [e] * len(batch.rows)
+        if any(errors):
+            # The cached layout may be stale if the table was altered elsewhere
+            schema_cache.invalidate(table_name)
+
+        with self._lock:
+            self.batches += 1
+            self.rows += len(batch.rows)
+            self.failed_rows += sum(error is not None for error in errors)
+        for future, error in zip(batch.futures, errors):
+            if future.done():
+                # The caller went away; its row is committed (or not) all the same
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(HTTPException(
+                    status_code=500, detail=f"Error inserting data into table '{table_name}': {str(error)}"
+                ))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": GROUP_COMMIT,
+                "max_rows": self.max_rows,
+                "max_wait_ms": self.max_wait_ms,
+                "batches": self.batches,
+                "rows": self.rows,
+                "failed_rows": self.failed_rows,
+                "avg_batch_rows": self.rows / self.batches if self.batches else 0.0,
+            }
+
+
+group_committer = GroupCommitter(GROUP_COMMIT_MAX_ROWS, GROUP_COMMIT_MAX_WAIT_MS)
@@ -0,0 +1,276 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from sqlalchemy.orm import Session
+from sqlalchemy import text, event
+from fastapi import HTTPException
+from cache import response_cache
+from database import DB_POOL_SIZE, SessionLocal, engine
+from statements import statement
+
+AGE_UPDATE_BATCH_SIZE = int(os.getenv("AGE_UPDATE_BATCH_SIZE", "10000"))
+# First key of the advisory locks that keep two runners off the same job
+JOB_LOCK_NAMESPACE = 4242
+# Jobs give up waiting for a table lock after this many milliseconds and retry with backoff
+JOB_LOCK_TIMEOUT_MS = int(os.getenv("JOB_LOCK_TIMEOUT_MS", "5000"))
+JOB_LOCK_RETRIES = int(os.getenv("JOB_LOCK_RETRIES", "3"))
+
+# How many jobs of each kind may run at once; the rest wait in the queue
+JOB_CONCURRENCY = {
+    kind: int(os.getenv(f"JOB_CONCURRENCY_{kind.upper()}", str(default)))
+    for kind, default in {"create_table": 4, "delete_table": 2, "update_table": 2, "update_age": 1}.items()
+}
+
+# Each running job holds one pooled connection for its whole run. Whatever the
+# JOB_CONCURRENCY limits add up to, at most this many jobs run at once, so
+# requests always keep part of the pool (serve.py shrinks DB_POOL_SIZE per worker)
+JOB_MAX_RUNNING = int(os.getenv("JOB_MAX_RUNNING", str(max(1, DB_POOL_SIZE - 1))))
+
+_executors = {}
+_running = threading.BoundedSemaphore(JOB_MAX_RUNNING)
+
+logger = logging.getLogger(__name__)
+
+_jobs_table_ready = False
+
+def ensure_jobs_table(db: Session):
+    """Create the job table once per process; it lives outside the public schema"""
+    global _jobs_table_ready
+    if _jobs_table_ready:
+        return
+    db.execute(text("CREATE SCHEMA IF NOT EXISTS daniam;"))
+    db.execute(text("""
+        CREATE TABLE IF NOT EXISTS daniam.jobs (
+            id BIGSERIAL PRIMARY KEY,
+            kind VARCHAR(50) NOT NULL,
+            table_name VARCHAR(63) NOT NULL,
+            username VARCHAR(63) NOT NULL,
+            params JSONB NOT NULL DEFAULT '{}',
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            last_id BIGINT NOT NULL DEFAULT 0,
+            max_id BIGINT NOT NULL DEFAULT 0,
+            rows_done BIGINT NOT NULL DEFAULT 0,
+            error TEXT,
+            result JSONB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """))
+    db.execute(text("ALTER TABLE daniam.jobs ADD COLUMN IF NOT EXISTS result JSONB;"))
+    db.commit()
+    _jobs_table_ready = True
+
+def create_job(db: Session, kind: str, table_name: str, username: str, params: dict, max_id: int = 0):
+    """Record a pending job in the caller's transaction and return its id"""
+    query = text("""
+        INSERT INTO daniam.jobs (kind, table_name, username, params, max_id)
+        VALUES (:kind, :table_name, :username, CAST(:params AS JSONB), :max_id)
+        RETURNING id;
+    """)
+    params = {"kind": kind, "table_name": table_name, "username": username,
+              "params": json.dumps(params), "max_id": max_id}
+    return db.execute(query, params).scalar()
+
+def get_job(db: Session, job_id: int):
+    """Get a job with its progress"""
+    ensure_jobs_table(db)
+    query = text("SELECT * FROM daniam.jobs WHERE id = :job_id;")
+    row = db.execute(query, {"job_id": job_id}).mappings().first()
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} does not exist")
+    job = dict(row)
+    job["progress"] = min(1.0, job["last_id"] / job["max_id"]) if job["max_id"] else 1.0
+    return job
+
+def get_user_job(db: Session, job_id: int, username: str):
+    """Get a job, visible only to the user that started it"""
+    job = get_job(db, job_id)
+    if job["username"] != username:
+        raise HTTPException(status_code=403, detail="Permission denied: Jobs are only visible to the user that started them")
+    return job
+
+def _set_job_status(db: Session, job_id: int, status: str, error: str = None, result=None):
+    query = text("""
+        UPDATE daniam.jobs
+        SET status = :status, error = :error, result = CAST(:result AS JSONB), updated_at = now()
+        WHERE id = :job_id;
+    """)
+    db.execute(query, {"job_id": job_id, "status": status, "error": error, "result": json.dumps(result)})
+
+def _set_lock_timeout(session, transaction, connection):
+    connection.exec_driver_sql(f"SET LOCAL lock_timeout = {JOB_LOCK_TIMEOUT_MS}")
+
+def _job_session(connection):
+    """Session on the job's connection whose every transaction gives up on lock waits after JOB_LOCK_TIMEOUT_MS"""
+    db = Session(bind=connection, autoflush=False)
+    event.listen(db, "after_begin", _set_lock_timeout)
+    return db
+
+def _is_lock_timeout(error: BaseException):
+    """Whether an error, or one it was raised from, is PostgreSQL's lock_not_available"""
+    while error is not None:
+        orig = getattr(error, "orig", None)
+        if getattr(orig, "pgcode", None) == "55P03" or getattr(orig, "sqlstate", None) == "55P03":
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+@contextmanager
+def _job_lock(job_id: int):
+    """Dedicated connection holding a session-level advisory lock for the job; yields None when another runner has it"""
+    lock_args = {"namespace": JOB_LOCK_NAMESPACE, "job_id": job_id}
+    acquired = False
+    lock_connection = engine.connect()
+    try:
+        acquired = lock_connection.execute(text("SELECT pg_try_advisory_lock(:namespace, :job_id);"), lock_args).scalar()
+        lock_connection.commit()
+        yield lock_connection if acquired else None
+    finally:
+        if acquired:
+            try:
+                lock_connection.rollback()
+                lock_connection.execute(text("SELECT pg_advisory_unlock(:namespace, :job_id);"), lock_args)
+                lock_connection.commit()
+            except Exception:
+                # Never return a connection that may still hold the lock to the pool
+                lock_connection.invalidate()
+        lock_connection.close()
+
+def run_age_update_job(db: Session, job: dict):
+    """Set age across a table in id-range batches, committing each batch with the job's progress.
+
+    Progress is stored in the same transaction as each batch, so an interrupted
+    job resumes exactly where it stopped.
+    """
+    job_id = job["id"]
+    table_name = job["table_name"]
+    new_age = job["params"]["new_age"]
+    batch_size = job["params"].get("batch_size") or AGE_UPDATE_BATCH_SIZE
+    last_id = job["last_id"]
+    max_id = job["max_id"]
+
+    query_batch = statement("update_age_range", table_name)
+    query_progress = text("""
+        UPDATE daniam.jobs
+        SET last_id = :last_id, rows_done = rows_done + :rows, updated_at = now()
+        WHERE id = :job_id;
+    """)
+    while last_id < max_id:
+        upper_id = min(last_id + batch_size, max_id)
+        for attempt in range(JOB_LOCK_RETRIES + 1):
+            try:
+                result = db.execute(query_batch, {"new_age": new_age, "last_id": last_id, "upper_id": upper_id})
+                db.execute(query_progress, {"job_id": job_id, "last_id": upper_id, "rows": result.rowcount})
+                db.commit()
+                break
+            except Exception as e:
+                db.rollback()
+                if attempt == JOB_LOCK_RETRIES or not _is_lock_timeout(e):
+                    raise
+                time.sleep(0.1 * 2 ** attempt)
+        response_cache.invalidate_tables(table_name)
+        last_id = upper_id
+    return None
+
+def _run_table_operation(db: Session, job: dict):
+    import crud  # crud imports this module
+    from models import UpdateTableRequest
+
+    kind = job["kind"]
+    if kind == "create_table":
+        crud.create_table(db, job["table_name"], job["username"])
+        return {"message": f"Table '{job['table_name']}' created successfully!"}
+    if kind == "delete_table":
+        return {"message": crud.delete_table_endpoint(db, job["table_name"], job["username"])}
+    if kind == "update_table":
+        request = UpdateTableRequest(**job["params"])
+        return crud.update_table_info(db, request, job["username"])
+    raise ValueError(f"Unknown job kind '{kind}'")
+
+def run_table_job(db: Session, job: dict):
+    """Run a queued create/delete/update of a table, retrying when a table lock cannot be taken in time"""
+    for attempt in range(JOB_LOCK_RETRIES + 1):
+        try:
+            return _run_table_operation(db, job)
+        except Exception as e:
+            db.rollback()
+            if attempt == JOB_LOCK_RETRIES or not _is_lock_timeout(e):
+                raise
+            time.sleep(0.1 * 2 ** attempt)
+
+def _mark_failed(job_id: int, error: str):
+    """Record a failure from outside the job's own session, e.g. when it could not get a connection"""
+    db = SessionLocal()
+    try:
+        db.execute(
+            text("UPDATE daniam.jobs SET status = 'failed', error = :error, updated_at = now() WHERE id = :job_id AND status <> 'completed';"),
+            {"job_id": job_id, "error": error},
+        )
+        db.commit()
+    except Exception:
+        logger.exception("Could not mark job %s as failed", job_id)
+    finally:
+        db.close()
+
+def run_job(job_id: int, kind: str):
+    """Run a job on its lock connection; any error, however early, leaves the job failed rather than pending"""
+    runner = run_age_update_job if kind == "update_age" else run_table_job
+    result = None
+    try:
+        with _running, _job_lock(job_id) as connection:
+            if connection is None:
+                return
+            db = _job_session(connection)
+            try:
+                job = get_job(db, job_id)
+                if job["status"] == "completed":
+                    return
+                _set_job_status(db, job_id, "running")
+                db.commit()
+                try:
+                    result = runner(db, job)
+                except Exception as e:
+                    db.rollback()
+                    detail = e.detail if isinstance(e, HTTPException) else str(e)
+                    _set_job_status(db, job_id, "failed", str(detail))
+                    db.commit()
+                    return
+                _set_job_status(db, job_id, "completed", result=result)
+                db.commit()
+            finally:
+                db.close()
+    except Exception as e:
+        logger.exception("Job %s failed", job_id)
+        _mark_failed(job_id, str(e))
+        return
+
+    # A batched age update scheduled by update_table_info continues as its own job
+    if result and "job_id" in result:
+        submit_job(result["job_id"], "update_age")
+
+def submit_job(job_id: int, kind: str):
+    """Queue a job on the executor for its kind"""
+    executor = _executors.get(kind)
+    if executor is None:
+        executor = _executors.setdefault(
+            kind, ThreadPoolExecutor(max_workers=JOB_CONCURRENCY[kind], thread_name_prefix=f"job-{kind}")
+        )
+    executor.submit(run_job, job_id, kind)
+
+def enqueue_job(db: Session, kind: str, table_name: str, username: str, params: dict = None):
+    """Record a job, queue it and return its id without waiting for it to run"""
+    ensure_jobs_table(db)
+    job_id = create_job(db, kind, table_name, username, params or {})
+    db.commit()
+    submit_job(job_id, kind)
+    return job_id
+
+def shutdown_jobs():
+    """Stop accepting jobs; queued ones stay pending in the job table and can be resumed"""
+    for executor in _executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+    _executors.clear()
@@ -1,20 +1,61 @@
 from fastapi import FastAPI, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from database import get_db
+from database import (
+    get_db, get_read_db, get_async_db, read_session, last_write, is_replica_session, remember_write, pool_stats,
+    engine, async_engine, replicas, READ_YOUR_WRITES_S, LAST_WRITE_COOKIE, LAST_WRITE_HEADER
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+import crud_async
 from crud import (
     test_query, create_table, insert_data, get_all_tables_info, 
     get_info_table, delete_table_endpoint, update_table_info,
-    create_user, create_roles
+    create_user, create_roles, bulk_insert_data, parse_bulk_rows,
+    stream_info_table, query_table, check_role1_permission, check_role2_permission,
+    check_role3_permission, get_tables_snapshot, export_table, check_insert,
+    BULK_INSERT_CHUNK_SIZE, STREAM_BATCH_SIZE, EXPORT_BATCH_SIZE
 )
 from sqlalchemy import text
-from models import InsertDataRequest, UpdateTableRequest, CreateTableAdmin, CreateTableRequest
+from models import InsertDataRequest, UpdateTableRequest, CreateTableAdmin, CreateTableRequest, QueryTableRequest
+from cache import schema_cache, role_cache, response_cache
+from jobs import get_user_job, enqueue_job, submit_job, shutdown_jobs
+from serialization import fast_json, dumps, render_json, FastJSONResponse
+from export import check_export, export_media, encode_export, content_disposition
+from group_commit import GROUP_COMMIT, group_committer
+from statements import statement_cache_stats
+from warmup import WARMUP, run_warm_up, status as warmup_status
+from admission import AdmissionMiddleware, admission_control
+from metrics import RequestQueryStats, current_query_stats, record_route, route_stats_snapshot
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse, Response
 from fastapi import Query
+from starlette.concurrency import run_in_threadpool
+from anyio import from_thread
+from typing import Optional, List
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import math
+import time
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up_task = asyncio.create_task(run_warm_up()) if WARMUP else None
+    if warm_up_task is None:
+        warmup_status["ready"] = True
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    shutdown_jobs()
+    for pool_engine in [engine] + [replica.engine for replica in replicas]:
+        pool_engine.dispose()
+    if async_engine is not None:
+        await async_engine.dispose()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Added before CORS so that 429 answers still carry the CORS headers
+app.add_middleware(AdmissionMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,12 +65,80 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_query_stats(request: Request, call_next):
+    """Count the SQL issued by each request and report it as Server-Timing"""
+    query_stats = RequestQueryStats()
+    token = current_query_stats.set(query_stats)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        current_query_stats.reset(token)
+    # The header goes out before a streamed body runs, so it only covers the work done up to here
+    response.headers["Server-Timing"] = query_stats.server_timing((time.perf_counter() - start) * 1000)
+    route = request.scope.get("route")
+    response.body_iterator = _record_after_body(
+        response.body_iterator, f"{request.method} {route.path}" if route else "unmatched", query_stats, start
+    )
+    return response
+
+async def _record_after_body(body, route: str, query_stats: RequestQueryStats, start: float):
+    """Pass the body through, then record the route, so streamed scans and exports are counted in full"""
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        record_route(route, query_stats, (time.perf_counter() - start) * 1000)
+
+@app.middleware("http")
+async def hand_back_last_write(request: Request, call_next):
+    """Give the client the time of a commit made by this request, so its next reads avoid replicas behind it"""
+    response = await call_next(request)
+    commit_time = getattr(request.state, "last_write", None)
+    if commit_time is not None:
+        value = f"{commit_time:.6f}"
+        response.headers[LAST_WRITE_HEADER] = value
+        response.set_cookie(LAST_WRITE_COOKIE, value, max_age=math.ceil(READ_YOUR_WRITES_S), httponly=True, samesite="lax")
+    return response
+
 app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+templates = None
+
+def get_templates():
+    # Jinja is only needed by the index page, so it is loaded on its first request
+    global templates
+    if templates is None:
+        from fastapi.templating import Jinja2Templates
+        templates = Jinja2Templates(directory="templates")
+    return templates
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return get_templates().TemplateResponse("index.html", {"request": request})
+
+@app.get("/ready")
+def ready():
+    """Readiness probe: 503 until the startup warm-up has finished"""
+    return JSONResponse(status_code=200 if warmup_status["ready"] else 503, content=warmup_status)
+
+@app.get("/cache_stats")
+def cache_stats():
+    return {
+        "schema": schema_cache.stats(),
+        "roles": role_cache.stats(),
+        "responses": response_cache.stats(),
+        "statements": statement_cache_stats(),
+    }
+
+@app.get("/metrics")
+def metrics():
+    return {
+        "pool": pool_stats(),
+        "routes": route_stats_snapshot(),
+        "group_commit": group_committer.stats(),
+        "admission": admission_control.stats(),
+    }
 
 @app.get("/test")
 def test_query_run(db: Session = Depends(get_db)):
@@ -84,45 +193,275 @@ def create_user_endpoint(request: CreateTableAdmin, db: Session = Depends(get_db
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _queued(job_id: int, message: str):
+    return JSONResponse(status_code=202, content={"message": message, "job_id": job_id})
+
 @app.post("/create_table")
-def create_table_endpoint(request: CreateTableRequest, db: Session = Depends(get_db)):
+def create_table_endpoint(request: CreateTableRequest, background: bool = False, db: Session = Depends(get_db)):
     try:
+        if background:
+            check_role1_permission(db, request.username)
+            job_id = enqueue_job(db, "create_table", request.table_name, request.username)
+            return _queued(job_id, f"Creation of table '{request.table_name}' queued")
         create_table(db, request.table_name, request.username)
         return {"message": f"Table '{request.table_name}' created successfully!"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+def _check_group_insert(db: Session, request: InsertDataRequest):
+    columns = check_insert(db, request.table_name, request.username)
+    # Hand the connection back to the pool while the row waits for its batch
+    db.rollback()
+    return columns
+
 @app.post("/insert_data")
-def insert_data_endpoint(request: InsertDataRequest, db: Session = Depends(get_db)):
+async def insert_data_endpoint(request: InsertDataRequest, db: Session = Depends(get_db)):
     try:
-        insert_data(db, request.table_name, request.name, request.age, request.username)
+        if GROUP_COMMIT:
+            # Checks run per request; the INSERT and its commit are shared with concurrent requests
+            name_column, age_column = await run_in_threadpool(_check_group_insert, db, request)
+            await group_committer.insert(request.table_name, name_column, age_column, request.name, request.age)
+            remember_write(db.info.get("request_state"))
+        else:
+            await run_in_threadpool(insert_data, db, request.table_name, request.name, request.age, request.username)
         return {"message": f"Data inserted into table '{request.table_name}' successfully!"}
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+def _iter_request_body(request: Request):
+    """Read the request body chunk by chunk from a threadpool worker"""
+    stream = request.stream()
+
+    async def next_chunk():
+        try:
+            return await stream.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    while True:
+        chunk = from_thread.run(next_chunk)
+        if chunk is None:
+            break
+        if chunk:
+            yield chunk
+
+@app.post("/insert_data/bulk")
+async def bulk_insert_data_endpoint(
+    request: Request,
+    table_name: str,
+    username: str,
+    chunk_size: int = Query(BULK_INSERT_CHUNK_SIZE, ge=1),
+    db: Session = Depends(get_db),
+):
+    """Insert a JSON array, NDJSON stream or CSV stream of {name, age} rows"""
+    rows = parse_bulk_rows(_iter_request_body(request), request.headers.get("content-type", ""))
+    try:
+        return await run_in_threadpool(bulk_insert_data, db, table_name, rows, username, chunk_size)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _cached_response(request: Request, endpoint: str, table_name: str, variant: str, build, store: bool = True):
+    """Serve a read from the response cache with an ETag, answering 304 when the client is current"""
+    cached = response_cache.get(endpoint, table_name, variant)
+    if cached is None:
+        generation = response_cache.generation(endpoint, table_name)
+        content = build()
+        body = render_json(endpoint, content)
+        if store:
+            etag = response_cache.set(endpoint, table_name, variant, body, generation)
+        else:
+            etag = response_cache.etag(body)
+    else:
+        body, etag = cached
+
+    if_none_match = request.headers.get("if-none-match", "")
+    client_etags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if etag in client_etags or "*" in client_etags:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
 @app.get("/get_all_tables")
-def get_tables(username: str, db: Session = Depends(get_db)):
+def get_tables(
+    request: Request,
+    username: str,
+    stats: bool = False,
+    exact_counts: bool = False,
+    db: Session = Depends(get_read_db),
+):
     try:
-        tables_info = get_all_tables_info(db, username)
-        return {"tables": tables_info}
+        if stats or exact_counts:
+            # Statistics move with every write, so they bypass the response cache
+            return {"tables": get_all_tables_info(db, username, stats=True, exact_counts=exact_counts)}
+        check_role2_permission(db, username)
+        return _cached_response(
+            request, "get_all_tables", "", "",
+            lambda: {"tables": get_all_tables_info(db, username)},
+            # A lagging replica could pin a stale body under the current generation
+            store=not is_replica_session(db),
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/get_info_table")
-def get_info_table_endpoint(username: str, db: Session = Depends(get_db), table_name: str = Query(...)):
+def get_info_table_endpoint(
+    request: Request,
+    username: str,
+    db: Session = Depends(get_read_db),
+    table_name: str = Query(...),
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+):
+    def build():
+        table_info = get_info_table(db, table_name, username, after_id, limit)
+        if limit is None:
+            return {"table_info": table_info}
+        # A full page means there may be more rows after the last id
+        next_after_id = table_info[-1]["id"] if len(table_info) == limit else None
+        return {"table_info": table_info, "next_after_id": next_after_id}
+
+    try:
+        check_role2_permission(db, username)
+        return _cached_response(
+            request, "get_info_table", table_name, f"{after_id}:{limit}", build,
+            store=not is_replica_session(db),
+        )
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/snapshot")
+def get_snapshot(
+    username: str,
+    tables: List[str] = Query([]),
+    rows: int = Query(20, ge=0),
+    db: Session = Depends(get_read_db),
+):
+    """Everything the dashboard needs in one request and one consistent view"""
     try:
-        table_info = get_info_table(db, table_name, username)
-        return {"table_info": table_info}
+        snapshot = get_tables_snapshot(db, username, tables, rows)
+        return FastJSONResponse(snapshot) if fast_json("snapshot") else snapshot
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _json_default(value):
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+def _encode_row_batches_fast(batches, format: str, db: Session):
+    """orjson variant of _encode_row_batches, encoding each batch in one call"""
+    try:
+        if format == "json":
+            yield b'{"table_info":['
+            first = True
+            for batch in batches:
+                # Drop the brackets of the encoded list to splice batches into one array
+                body = dumps([dict(row) for row in batch])[1:-1]
+                yield body if first or not body else b"," + body
+                first = first and not body
+            yield b"]}"
+        else:
+            for batch in batches:
+                yield b"".join(dumps(dict(row)) + b"\n" for row in batch)
+    finally:
+        db.close()
+
+def _encode_row_batches(batches, format: str, db: Session):
+    """Encode batches of rows as NDJSON lines or one chunked JSON document, then close the session"""
+    if fast_json("get_info_table/stream"):
+        yield from _encode_row_batches_fast(batches, format, db)
+        return
+    try:
+        if format == "json":
+            yield '{"table_info": ['
+            first = True
+            for batch in batches:
+                body = ",".join(json.dumps(dict(row), default=_json_default) for row in batch)
+                yield body if first else "," + body
+                first = False
+            yield "]}"
+        else:
+            for batch in batches:
+                yield "".join(json.dumps(dict(row), default=_json_default) + "\n" for row in batch)
+    finally:
+        db.close()
+
+@app.get("/get_info_table/stream")
+def stream_info_table_endpoint(
+    request: Request,
+    username: str,
+    table_name: str = Query(...),
+    format: str = Query("ndjson", pattern="^(ndjson|json)$"),
+    batch_size: int = Query(STREAM_BATCH_SIZE, ge=1),
+):
+    # The session must outlive this function, so it is owned by the response body
+    db = read_session(last_write(request))
+    try:
+        batches = stream_info_table(db, table_name, username, batch_size)
+    except HTTPException as e:
+        db.close()
+        raise e
+    except Exception as e:
+        db.close()
+        raise HTTPException(status_code=500, detail=str(e))
+    media_type = "application/json" if format == "json" else "application/x-ndjson"
+    return StreamingResponse(_encode_row_batches(batches, format, db), media_type=media_type)
+
+def _export_body(columns, batches, format: str, compression: str, db: Session):
+    try:
+        yield from encode_export(columns, batches, format, compression)
+    finally:
+        db.close()
+
+@app.get("/export_table")
+def export_table_endpoint(
+    request: Request,
+    username: str,
+    table_name: str = Query(...),
+    format: str = Query("csv", pattern="^(csv|ndjson|arrow|parquet)$"),
+    compression: str = Query("gzip", pattern="^(none|gzip|zstd)$"),
+    batch_size: int = Query(EXPORT_BATCH_SIZE, ge=1),
+):
+    """Download a whole table as compressed CSV or NDJSON, an Arrow IPC stream or a Parquet file"""
+    check_export(format, compression)
+    # The session must outlive this function, so it is owned by the response body
+    db = read_session(last_write(request))
+    try:
+        columns, batches = export_table(db, table_name, username, batch_size)
+        media_type, filename = export_media(table_name, format, compression)
+        return StreamingResponse(
+            _export_body(columns, batches, format, compression, db),
+            media_type=media_type,
+            headers={"Content-Disposition": content_disposition(filename)},
+        )
+    except HTTPException as e:
+        db.close()
+        raise e
+    except Exception as e:
+        db.close()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/query_table")
+def query_table_endpoint(request: QueryTableRequest, db: Session = Depends(get_db)):
+    try:
+        return query_table(db, request, request.username)
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/delete_table/{table_name}")
-def delete_table(table_name: str, username: str, db: Session = Depends(get_db)):
+def delete_table(table_name: str, username: str, background: bool = False, db: Session = Depends(get_db)):
     try:
+        if background:
+            check_role2_permission(db, username)
+            job_id = enqueue_job(db, "delete_table", table_name, username)
+            return _queued(job_id, f"Deletion of table '{table_name}' queued")
         message = delete_table_endpoint(db, table_name, username)
         return {"message": message}
     except HTTPException as e:
@@ -131,11 +470,98 @@ def delete_table(table_name: str, username: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/update_table")
-def update_table(request: UpdateTableRequest, db: Session = Depends(get_db)):
+def update_table(request: UpdateTableRequest, background: bool = False, db: Session = Depends(get_db)):
     try:
+        if background:
+            check_role3_permission(db, request.username)
+            job_id = enqueue_job(db, "update_table", request.table_name, request.username, request.model_dump())
+            return _queued(job_id, f"Update of table '{request.table_name}' queued")
         result = update_table_info(db, request, request.username)
+        if "job_id" in result:
+            submit_job(result["job_id"], "update_age")
         return result
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: int, username: str, db: Session = Depends(get_db)):
+    try:
+        return get_user_job(db, job_id, username)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/jobs/{job_id}/resume")
+def resume_job(job_id: int, username: str, db: Session = Depends(get_db)):
+    """Queue an interrupted or failed job again; age updates continue from their last committed batch"""
+    try:
+        job = get_user_job(db, job_id, username)
+        if job["status"] == "completed":
+            raise HTTPException(status_code=400, detail=f"Job {job_id} has already completed")
+        submit_job(job_id, job["kind"])
+        return {"message": f"Job {job_id} resumed", "job": job}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Async routes on the asyncpg engine. They run on the event loop instead of the
+# threadpool; the sync routes above stay available for comparison.
+
+@app.post("/async/create_table")
+async def async_create_table_endpoint(request: CreateTableRequest, db: AsyncSession = Depends(get_async_db)):
+    try:
+        await crud_async.create_table(db, request.table_name, request.username)
+        return {"message": f"Table '{request.table_name}' created successfully!"}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/async/insert_data")
+async def async_insert_data_endpoint(request: InsertDataRequest, db: AsyncSession = Depends(get_async_db)):
+    try:
+        await crud_async.insert_data(db, request.table_name, request.name, request.age, request.username)
+        return {"message": f"Data inserted into table '{request.table_name}' successfully!"}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/async/get_all_tables")
+async def async_get_tables(username: str, db: AsyncSession = Depends(get_async_db)):
+    try:
+        tables_info = await crud_async.get_all_tables_info(db, username)
+        return {"tables": tables_info}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/async/get_info_table")
+async def async_get_info_table_endpoint(
+    username: str,
+    db: AsyncSession = Depends(get_async_db),
+    table_name: str = Query(...),
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+):
+    try:
+        table_info = await crud_async.get_info_table(db, table_name, username, after_id, limit)
+        if limit is None:
+            return {"table_info": table_info}
+        next_after_id = table_info[-1]["id"] if len(table_info) == limit else None
+        return {"table_info": table_info, "next_after_id": next_after_id}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/async/delete_table/{table_name}")
+async def async_delete_table(table_name: str, username: str, db: AsyncSession = Depends(get_async_db)):
+    try:
+        message = await crud_async.delete_table_endpoint(db, table_name, username)
+        return {"message": message}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,173 @@
+import contextvars
+import threading
+
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Latency histogram over fixed millisecond buckets"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value_ms: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value_ms <= bound:
+                index = i
+                break
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_ms += value_ms
+            self.max_ms = max(self.max_ms, value_ms)
+
+    def snapshot(self):
+        with self._lock:
+            labels = [f"le_{bound}ms" for bound in self.buckets] + ["inf"]
+            return {
+                "count": self.count,
+                "avg_ms": self.total_ms / self.count if self.count else 0.0,
+                "max_ms": self.max_ms,
+                "buckets": dict(zip(labels, self.counts)),
+            }
+
+
+class PoolMetrics:
+    """Checkout counters for one connection pool"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_ms_total = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.checkout_latency = Histogram()
+        self._lock = threading.Lock()
+
+    def record_checkout(self, elapsed_ms: float, waited: bool, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_ms_total += elapsed_ms
+            if timed_out:
+                self.timeouts += 1
+        self.checkout_latency.observe(elapsed_ms)
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = {
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_ms_total": self.wait_ms_total,
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+            }
+        stats["checkout_latency_ms"] = self.checkout_latency.snapshot()
+        return stats
+
+
+class RequestQueryStats:
+    """SQL statements issued while serving one request"""
+
+    def __init__(self):
+        self.statements = 0
+        self.failed = 0
+        self.db_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_statement = None
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, elapsed_ms: float, failed: bool = False):
+        with self._lock:
+            self.statements += 1
+            if failed:
+                self.failed += 1
+            self.db_ms += elapsed_ms
+            if elapsed_ms >= self.slowest_ms:
+                self.slowest_ms = elapsed_ms
+                self.slowest_statement = statement
+
+    def server_timing(self, total_ms: float):
+        """Server-Timing header value for this request"""
+        return (
+            f'db;dur={self.db_ms:.2f};desc="{self.statements} statements", '
+            f"db-slowest;dur={self.slowest_ms:.2f}, "
+            f"app;dur={total_ms:.2f}"
+        )
+
+
+# Stats of the request being served; the object is shared with threadpool workers
+current_query_stats = contextvars.ContextVar("current_query_stats", default=None)
+
+
+def compact_sql(statement: str, limit: int = 300):
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + "..."
+
+
+class RouteStats:
+    """Request latency and SQL usage aggregated per route"""
+
+    def __init__(self):
+        self.requests = 0
+        self.statements = 0
+        self.failed_statements = 0
+        self.db_ms_total = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_statement = None
+        self.latency = Histogram()
+        self._lock = threading.Lock()
+
+    def record(self, query_stats: RequestQueryStats, total_ms: float):
+        with self._lock:
+            self.requests += 1
+            self.statements += query_stats.statements
+            self.failed_statements += query_stats.failed
+            self.db_ms_total += query_stats.db_ms
+            if query_stats.slowest_statement is not None and query_stats.slowest_ms >= self.slowest_ms:
+                self.slowest_ms = query_stats.slowest_ms
+                self.slowest_statement = compact_sql(query_stats.slowest_statement)
+        self.latency.observe(total_ms)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "statements": self.statements,
+                "avg_statements": self.statements / self.requests if self.requests else 0.0,
+                "failed_statements": self.failed_statements,
+                "db_ms_total": self.db_ms_total,
+                "avg_db_ms": self.db_ms_total / self.requests if self.requests else 0.0,
+                "slowest_statement_ms": self.slowest_ms,
+                "slowest_statement": self.slowest_statement,
+                "latency_ms": self.latency.snapshot(),
+            }
+
+
+route_stats = {}
+_route_stats_lock = threading.Lock()
+
+
+def record_route(route: str, query_stats: RequestQueryStats, total_ms: float):
+    with _route_stats_lock:
+        stats = route_stats.get(route)
+        if stats is None:
+            stats = route_stats[route] = RouteStats()
+    stats.record(query_stats, total_ms)
+
+
+def route_stats_snapshot():
+    with _route_stats_lock:
+        routes = dict(route_stats)
+    return {route: stats.snapshot() for route, stats in sorted(routes.items())}
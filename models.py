@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field
 from sqlalchemy import text
 from fastapi import Query
-from typing import Optional, List
+from typing import Optional, List, Literal
 
 class InsertDataRequest(BaseModel):
     table_name: str
@@ -19,6 +19,8 @@ class UpdateTableRequest(BaseModel):
     new_table_name: Optional[str] = None
     new_name: Optional[str] = None
     new_age: Optional[int] = None
+    # Update ages in id-range batches of this size as a resumable background job
+    batch_size: Optional[int] = Field(None, ge=1)
     username: str
 
 class CreateTableAdmin(BaseModel):
@@ -35,3 +37,19 @@ class ModifyRolePermissionsRequest(BaseModel):
     username: str
     permission: str
     action: str = "grant"  # "grant" or "revoke"
+
+class QueryTableRequest(BaseModel):
+    table_name: str
+    username: str
+    # Filters
+    min_age: Optional[int] = None
+    max_age: Optional[int] = None
+    name_prefix: Optional[str] = None
+    # Aggregates over the age column, optionally per group
+    aggregates: Optional[List[Literal["count", "avg", "min", "max"]]] = None
+    group_by: Optional[Literal["name", "age"]] = None
+    # Rows are ordered by a column, groups by the group key or an aggregate
+    order_by: Optional[Literal["id", "name", "age", "created_at", "count", "avg", "min", "max"]] = None
+    descending: bool = False
+    limit: Optional[int] = Field(None, ge=1)
+    create_indexes: bool = False
@@ -0,0 +1,56 @@
+import decimal
+import json
+import os
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Endpoints whose responses are rendered with orjson instead of jsonable_encoder and
+# the stdlib json module. Set to an empty string to render everything the stdlib way.
+FAST_JSON_ENDPOINTS = {
+    name.strip()
+    for name in os.getenv("FAST_JSON_ENDPOINTS", "get_info_table,get_info_table/stream,snapshot").split(",")
+    if name.strip()
+}
+
+
+def fast_json(endpoint: str):
+    """Whether an endpoint renders through orjson; needs the optional orjson package"""
+    return orjson is not None and endpoint in FAST_JSON_ENDPOINTS
+
+
+def _default(value):
+    # orjson handles datetimes, dates and UUIDs natively; match jsonable_encoder for the rest
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).decode()
+    return str(value)
+
+
+def dumps(content) -> bytes:
+    """Encode content with orjson, or the stdlib json module when orjson is missing"""
+    if orjson is None:
+        return json.dumps(content, default=_default, separators=(",", ":")).encode()
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def render_json(endpoint: str, content) -> bytes:
+    """Response body of an endpoint, encoded the way that endpoint is configured to"""
+    return dumps(content) if fast_json(endpoint) else JSONResponse(jsonable_encoder(content)).body
+
+
+def rows_to_dicts(columns, rows):
+    """Pair each result tuple with the column list, skipping Row._mapping"""
+    return [dict(zip(columns, row)) for row in rows]
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by orjson, for content that is already JSON-shaped"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
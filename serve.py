@@ -0,0 +1,141 @@
+"""Production entry point: serves main:app from several worker processes.
+
+Each worker is a separate process with its own pools, caches and job queues.
+The launcher splits DB_CONNECTION_BUDGET (the connections the whole deployment
+may hold on one PostgreSQL server) across the workers' pools and tells the
+admission control how many workers share its budgets. On SIGTERM or SIGINT,
+workers stop accepting connections and finish in-flight requests for up to
+--graceful-timeout seconds before running the app's shutdown.
+
+A worker only sees its own cache invalidations. With more than one worker the
+response cache must be shared (RESPONSE_CACHE_BACKEND=redis); left unset it is
+turned off. Missing tables and denied roles are re-read instead of cached, but
+a cached table layout may lag a rename or drop made on another worker by up to
+SCHEMA_CACHE_TTL seconds; such requests fail rather than return stale rows.
+Read-your-writes travels with the client (see READ_YOUR_WRITES_S in
+database.py), so it holds whichever worker serves the next read.
+
+    python serve.py --workers 4
+    python serve.py --workers 4 --preload   # gunicorn master; the app is imported once and forked
+"""
+import argparse
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _available(module: str):
+    return importlib.util.find_spec(module) is not None
+
+
+def pool_settings(workers: int, budget: int):
+    """(pool_size, max_overflow) per pool so that all workers together stay within budget"""
+    # A worker holds a psycopg2 pool and, with asyncpg installed, an asyncpg pool
+    pools = 2 if _available("asyncpg") else 1
+    per_pool = budget // (workers * pools)
+    if per_pool < 1:
+        raise ValueError(
+            f"{budget} database connections cannot give {workers} workers a connection per pool; "
+            f"use at most {budget // pools} workers or raise --db-connections"
+        )
+    pool_size = max(1, per_pool * 2 // 3)
+    return pool_size, per_pool - pool_size
+
+
+def configure(workers: int, budget: int):
+    """Set the environment the workers read their share of the limits from; explicit settings win"""
+    pool_size, max_overflow = pool_settings(workers, budget)
+    if workers > 1:
+        backend = os.environ.setdefault("RESPONSE_CACHE_BACKEND", "none").lower()
+        if backend == "memory":
+            raise ValueError("RESPONSE_CACHE_BACKEND=memory would serve stale responses with several workers; use redis or none")
+    os.environ.setdefault("DB_POOL_SIZE", str(pool_size))
+    os.environ.setdefault("DB_MAX_OVERFLOW", str(max_overflow))
+    os.environ["WEB_WORKERS"] = str(workers)
+
+
+def run_uvicorn(args):
+    import uvicorn
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop="uvloop" if _available("uvloop") else "auto",
+        http="httptools" if _available("httptools") else "auto",
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+    )
+
+
+def _post_fork(server, worker):
+    import database
+
+    # Pools created in the master before forking must not share sockets with the workers
+    database.engine.dispose(close=False)
+    for replica in database.replicas:
+        replica.engine.dispose(close=False)
+    if database.async_engine is not None:
+        database.async_engine.sync_engine.dispose(close=False)
+
+
+def run_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    # uvicorn's bundled worker moved to the uvicorn-worker package
+    worker_class = "uvicorn_worker.UvicornWorker" if _available("uvicorn_worker") else "uvicorn.workers.UvicornWorker"
+    options = {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "worker_class": worker_class,
+        "preload_app": True,
+        "graceful_timeout": args.graceful_timeout,
+        "post_fork": _post_fork,
+        "loglevel": args.log_level,
+    }
+
+    class PreforkApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            import main
+
+            return main.app
+
+    PreforkApplication().run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("WEB_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("WEB_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", str(os.cpu_count() or 1))))
+    parser.add_argument("--preload", action="store_true", default=os.getenv("WEB_PRELOAD", "false").lower() in ["1", "true", "yes"],
+                        help="run under gunicorn, importing the app once before forking the workers")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30")),
+                        help="seconds in-flight requests get to finish on shutdown")
+    parser.add_argument("--db-connections", type=int, default=int(os.getenv("DB_CONNECTION_BUDGET", "60")),
+                        help="connections all workers together may open to the database")
+    parser.add_argument("--log-level", default=os.getenv("WEB_LOG_LEVEL", "info"))
+    args = parser.parse_args()
+
+    # Static files and templates are looked up relative to the app directory
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    try:
+        configure(args.workers, args.db_connections)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.preload:
+        run_gunicorn(args)
+    else:
+        run_uvicorn(args)
+
+
+if __name__ == "__main__":
+    main()
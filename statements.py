@@ -0,0 +1,80 @@
+import os
+from functools import lru_cache
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+# Per-table statements are built once per (operation, table, columns) and reused,
+# so repeated calls skip rebuilding and re-parsing the SQL text. Drivers that
+# prepare statements server-side (asyncpg, psycopg 3) then see identical SQL and
+# reuse their prepared plans; see DB_PREPARED_STATEMENT_CACHE_SIZE in database.py.
+STATEMENT_CACHE_SIZE = int(os.getenv("STATEMENT_CACHE_SIZE", "1024"))
+
+_preparer = postgresql.dialect().identifier_preparer
+
+STATEMENTS = {
+    "create": (
+        "CREATE TABLE IF NOT EXISTS {table} ("
+        "id SERIAL PRIMARY KEY, "
+        "name VARCHAR(100) NOT NULL, "
+        "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+        "age INT NOT NULL);"
+    ),
+    "rename_table": "ALTER TABLE {table} RENAME TO {new_table};",
+    "rename_column": "ALTER TABLE {table} RENAME COLUMN {column} TO {new_column};",
+    "create_index": "CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {table} ({column});",
+    # text_pattern_ops lets LIKE 'prefix%' use the index under any collation
+    "create_prefix_index": "CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {table} ({column} text_pattern_ops);",
+    "insert": "INSERT INTO {table} ({name_column}, {age_column}) VALUES (:name, :age);",
+    "insert_many": (
+        "INSERT INTO {table} ({name_column}, {age_column}) "
+        "SELECT * FROM unnest(CAST(:names AS TEXT[]), CAST(:ages AS INT[]));"
+    ),
+    "select_all": "SELECT * FROM {table};",
+    "select_ordered": "SELECT * FROM {table} ORDER BY id;",
+    "select_page": "SELECT * FROM {table} WHERE id > :after_id ORDER BY id LIMIT :limit;",
+    "select_first": "SELECT * FROM {table} LIMIT :rows;",
+    "select_first_ordered": "SELECT * FROM {table} ORDER BY id LIMIT :rows;",
+    "select_columns": "SELECT {columns} FROM {table};",
+    "select_columns_ordered": "SELECT {columns} FROM {table} ORDER BY id;",
+    "count": "SELECT COUNT(*) FROM {table};",
+    "max_id": "SELECT COALESCE(MAX(id), 0) FROM {table};",
+    "update_age": "UPDATE {table} SET age = :new_age;",
+    "update_age_range": "UPDATE {table} SET age = :new_age WHERE id > :last_id AND id <= :upper_id;",
+    "drop": "DROP TABLE IF EXISTS {table};",
+}
+
+
+def quote(identifier: str):
+    """Quote a table or column name, escaping embedded double quotes"""
+    return _preparer.quote_identifier(identifier)
+
+
+def quote_text(identifier: str):
+    """quote() for SQL that goes through text(), which would read ':word' even inside quotes as a bind parameter"""
+    return quote(identifier).replace(":", "\\:")
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def statement(operation: str, table_name: str, **columns):
+    """Get the statement for an operation on a table; identifiers are quoted, values stay bind parameters.
+
+    Columns are keyword arguments naming the columns the template refers to; a
+    tuple of names is quoted into a comma-separated list.
+    """
+    quoted = {
+        key: ", ".join(quote_text(name) for name in value) if isinstance(value, tuple) else quote_text(value)
+        for key, value in columns.items()
+    }
+    return text(STATEMENTS[operation].format(table=quote_text(table_name), **quoted))
+
+
+def statement_cache_stats():
+    info = statement.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_rate": info.hits / lookups if lookups else 0.0,
+    }
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import pytest
+import admission
+from admission import AdmissionControl, AdmissionMiddleware, Budget, classify
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission, "time", clock)
+    return clock
+
+
+def control(rate=1, burst=2, user_concurrency=0, route_concurrency=0):
+    return AdmissionControl({"default": Budget("default", rate, burst, user_concurrency, route_concurrency)})
+
+
+def test_bucket_allows_burst_then_refills(clock):
+    ac = control(rate=1, burst=2)
+    assert ac.admit("u", "default", None) is None
+    assert ac.admit("u", "default", None) is None
+    assert ac.admit("u", "default", None) == ("rate", 1)
+    clock.now += 1
+    assert ac.admit("u", "default", None) is None
+    assert ac.admit("u", "default", None) == ("rate", 1)
+    # Refill never goes past the burst
+    clock.now += 100
+    assert [ac.admit("u", "default", None) for _ in range(3)] == [None, None, ("rate", 1)]
+    assert ac.stats()["rejected"] == {"default:rate": 3}
+
+
+def test_users_have_separate_buckets(clock):
+    ac = control(rate=1, burst=1)
+    assert ac.admit("a", "default", None) is None
+    assert ac.admit("b", "default", None) is None
+    assert ac.admit("a", "default", None) is not None
+
+
+def test_idle_buckets_are_dropped(clock, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_MAX_USERS", 2)
+    ac = control(rate=1, burst=2)
+    ac.admit("a", "default", None)
+    clock.now += 10
+    ac.admit("b", "default", None)
+    # "a" has refilled to its burst, "b" has not
+    ac.admit("c", "default", None)
+    assert set(ac._buckets) == {("b", "default"), ("c", "default")}
+
+
+def test_user_and_route_concurrency(clock):
+    ac = control(rate=0, burst=1, user_concurrency=1, route_concurrency=2)
+    assert ac.admit("a", "default", "GET /x") is None
+    assert ac.admit("a", "default", "GET /x") == ("user concurrency", 1)
+    assert ac.admit("b", "default", "GET /x") is None
+    assert ac.admit("c", "default", "GET /x") == ("route concurrency", 1)
+    ac.release("a", "default", "GET /x")
+    assert ac.admit("c", "default", "GET /x") is None
+    ac.release("b", "default", "GET /x")
+    ac.release("c", "default", "GET /x")
+    assert ac.stats()["in_flight"] == {} and ac._route_active == {}
+
+
+def test_classify():
+    assert classify("DELETE", "/delete_table/t", {}, {}) == ("drop", "DELETE /delete_table")
+    assert classify("PUT", "/update_table", {}, {"new_age": 5}) == ("bulk", "PUT /update_table")
+    assert classify("PUT", "/update_table", {}, {"new_name": "n"}) == ("default", None)
+    assert classify("GET", "/get_info_table", {}, {})[0] == "scan"
+    assert classify("GET", "/get_info_table", {"limit": ["10"]}, {}) == ("default", None)
+    assert classify("GET", "/get_all_tables", {"exact_counts": ["true"]}, {})[0] == "scan"
+
+
+def call(app, method, path, body=b"", query=b"", chunk_size=None):
+    """Run one request through an ASGI app; returns the sent messages"""
+    chunk_size = chunk_size or max(1, len(body))
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b""]
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+    sent = []
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query,
+        "client": ("127.0.0.1", 1),
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    }
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return sent
+
+
+class EchoApp:
+    """Downstream app that reads the whole body the way FastAPI does and echoes it"""
+
+    async def __call__(self, scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": body})
+
+
+@pytest.fixture
+def middleware(monkeypatch, clock):
+    monkeypatch.setattr(admission, "ADMISSION_CONTROL", True)
+    ac = AdmissionControl({
+        "default": Budget("default", 0, 1, 0, 0),
+        "bulk": Budget("bulk", 1, 1, 0, 0),
+    })
+    monkeypatch.setattr(admission, "admission_control", ac)
+    return AdmissionMiddleware(EchoApp())
+
+
+def test_body_is_replayed_downstream(middleware):
+    body = json.dumps({"username": "u", "table_name": "t", "new_age": 3}).encode()
+    sent = call(middleware, "PUT", "/update_table", body, chunk_size=5)
+    assert sent[0]["status"] == 200
+    assert sent[1]["body"] == body
+    assert admission.admission_control.stats()["in_flight"] == {}
+
+
+def test_over_budget_gets_429_with_retry_after(middleware):
+    body = json.dumps({"username": "u", "new_age": 3}).encode()
+    assert call(middleware, "PUT", "/update_table", body)[0]["status"] == 200
+    sent = call(middleware, "PUT", "/update_table", body)
+    assert sent[0]["status"] == 429
+    assert dict(sent[0]["headers"])[b"retry-after"] == b"1"
+    # Another user has their own bucket
+    other = json.dumps({"username": "v", "new_age": 3}).encode()
+    assert call(middleware, "PUT", "/update_table", other)[0]["status"] == 200
+
+
+def test_exempt_paths_are_not_counted(middleware):
+    call(middleware, "GET", "/metrics")
+    assert admission.admission_control.admitted == 0
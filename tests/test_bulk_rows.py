@@ -0,0 +1,67 @@
+import pytest
+from fastapi import HTTPException
+from crud import parse_bulk_rows, _validate_bulk_row
+
+
+def rows(body: bytes, content_type: str, chunk_size: int = 7):
+    # Split the body across chunks the way a streamed request arrives
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    return list(parse_bulk_rows(chunks, content_type))
+
+
+def test_json_array():
+    assert rows(b'[{"name": "a", "age": 1}, {"name": "b", "age": 2}]', "application/json") == [
+        {"name": "a", "age": 1},
+        {"name": "b", "age": 2},
+    ]
+
+
+def test_json_must_be_an_array():
+    with pytest.raises(HTTPException) as e:
+        rows(b'{"name": "a", "age": 1}', "application/json")
+    assert e.value.status_code == 400
+
+
+def test_invalid_json():
+    with pytest.raises(HTTPException) as e:
+        rows(b'[{"name": ', "application/json; charset=utf-8")
+    assert e.value.status_code == 400
+
+
+def test_ndjson_skips_blank_lines_and_passes_bad_lines_on():
+    body = b'{"name": "a", "age": 1}\n\n{"name": "b", "age": 2}\nnot json\n'
+    parsed = rows(body, "application/x-ndjson")
+    assert parsed[:2] == [{"name": "a", "age": 1}, {"name": "b", "age": 2}]
+    assert len(parsed) == 3 and not isinstance(parsed[2], dict)
+
+
+def test_csv():
+    assert rows(b"name,age\na,1\nb,2\n", "text/csv") == [{"name": "a", "age": "1"}, {"name": "b", "age": "2"}]
+
+
+def test_unsupported_content_type():
+    with pytest.raises(HTTPException) as e:
+        rows(b"a", "application/xml")
+    assert e.value.status_code == 415
+
+
+def test_validate_row():
+    assert _validate_bulk_row({"name": "a", "age": 3}) == ("a", 3)
+    # CSV values arrive as strings
+    assert _validate_bulk_row({"name": "a", "age": "3"}) == ("a", 3)
+
+
+@pytest.mark.parametrize("row", [
+    "not an object",
+    {"name": "a"},
+    {"age": 1},
+    {"name": 1, "age": 1},
+    {"name": "x" * 101, "age": 1},
+    {"name": "a", "age": 1.5},
+    {"name": "a", "age": True},
+    {"name": "a", "age": "old"},
+    {"name": "a", "age": None},
+])
+def test_validate_rejects(row):
+    with pytest.raises(ValueError):
+        _validate_bulk_row(row)
@@ -0,0 +1,94 @@
+import csv
+import datetime
+import gzip
+import io
+import json
+from urllib.parse import unquote
+import pytest
+from export import FORMATS, COMPRESSIONS, content_disposition, encode_export, export_media
+
+COLUMNS = [
+    {"column_name": "id", "data_type": "integer"},
+    {"column_name": "name", "data_type": "character varying"},
+    {"column_name": "created_at", "data_type": "timestamp without time zone"},
+    {"column_name": "age", "data_type": "integer"},
+]
+CREATED = datetime.datetime(2024, 1, 2, 3, 4, 5)
+ROWS = [(1, "ann", CREATED, 30), (2, "bob, jr", CREATED, 41), (3, "cé", CREATED, 7)]
+NAMES = [col["column_name"] for col in COLUMNS]
+
+
+def export(format, compression, rows, batch_size=2):
+    batches = iter([rows[i:i + batch_size] for i in range(0, len(rows), batch_size)])
+    return b"".join(encode_export(COLUMNS, batches, format, compression))
+
+
+def decompress(data, format, compression):
+    media_type, _ = export_media("t", format, compression)
+    if media_type == "application/gzip":
+        return gzip.decompress(data)
+    if media_type == "application/zstd":
+        zstandard = pytest.importorskip("zstandard")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+def read(data, format):
+    """Rows of an export as lists of strings"""
+    if format == "csv":
+        return list(csv.reader(io.StringIO(data.decode())))
+    if format == "ndjson":
+        rows = [json.loads(line) for line in data.decode().splitlines()]
+        return [NAMES] + [[str(row[name]) for name in NAMES] for row in rows]
+    pa = pytest.importorskip("pyarrow")
+    if format == "parquet":
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(io.BytesIO(data))
+    else:
+        table = pa.ipc.open_stream(data).read_all()
+    return [table.column_names] + [[str(value) for value in row.values()] for row in table.to_pylist()]
+
+
+@pytest.mark.parametrize("compression", list(COMPRESSIONS))
+@pytest.mark.parametrize("format", list(FORMATS))
+@pytest.mark.parametrize("rows", [ROWS, []], ids=["rows", "empty"])
+def test_round_trip(format, compression, rows):
+    if format in ("arrow", "parquet"):
+        pytest.importorskip("pyarrow")
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    data = decompress(export(format, compression, rows), format, compression)
+    expected = [NAMES] + [[str(value) for value in row] for row in rows]
+    if format == "ndjson":
+        # NDJSON has no header line and writes timestamps in ISO format
+        expected = [NAMES] + [[str(v.isoformat() if isinstance(v, datetime.datetime) else v) for v in row] for row in rows]
+        assert (data == b"") == (not rows)
+    assert read(data, format) == expected
+
+
+def test_empty_csv_has_its_header():
+    assert export("csv", "none", []) == b"id,name,created_at,age\r\n"
+
+
+@pytest.mark.parametrize("format, compression, media_type, filename", [
+    ("csv", "none", "text/csv", "t.csv"),
+    ("csv", "gzip", "application/gzip", "t.csv.gz"),
+    ("ndjson", "zstd", "application/zstd", "t.ndjson.zst"),
+    ("arrow", "gzip", "application/gzip", "t.arrows.gz"),
+    # Compressed inside the file
+    ("arrow", "zstd", "application/vnd.apache.arrow.stream", "t.arrows"),
+    ("parquet", "gzip", "application/vnd.apache.parquet", "t.parquet"),
+])
+def test_export_media(format, compression, media_type, filename):
+    assert export_media("t", format, compression) == (media_type, filename)
+
+
+@pytest.mark.parametrize("filename", ["people.csv", "таблица.csv.gz", 'a"b; c.csv'])
+def test_content_disposition(filename):
+    header = content_disposition(filename)
+    # Starlette sends headers as Latin-1
+    header.encode("latin-1")
+    fallback = header.split('filename="')[1].split('"')[0]
+    assert fallback.isascii() and '"' not in fallback
+    assert unquote(header.split("filename*=UTF-8''")[1]) == filename
@@ -0,0 +1,113 @@
+import asyncio
+import time
+import pytest
+from fastapi import HTTPException
+import group_commit
+from group_commit import GroupCommitter, _commit_batch
+
+KEY = ("t", "name", "age")
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """Rows of every batch handed to the database, with row 'bad' failing"""
+    committed = []
+
+    def commit(table_name, name_column, age_column, rows):
+        committed.append(list(rows))
+        return [ValueError("bad row") if name == "bad" else None for name, _ in rows]
+
+    monkeypatch.setattr(group_commit, "_commit_batch", commit)
+    return committed
+
+
+def insert_all(committer, names):
+    async def run():
+        return await asyncio.gather(
+            *(committer.insert(*KEY, name, 1) for name in names), return_exceptions=True
+        )
+
+    return asyncio.run(run())
+
+
+def test_flushes_when_full(batches):
+    committer = GroupCommitter(max_rows=3, max_wait_ms=10000)
+    start = time.monotonic()
+    assert insert_all(committer, ["a", "b", "c"]) == [None, None, None]
+    # Did not wait for the timer
+    assert time.monotonic() - start < 5
+    assert batches == [[("a", 1), ("b", 1), ("c", 1)]]
+
+
+def test_full_batch_starts_the_next_one(batches):
+    committer = GroupCommitter(max_rows=2, max_wait_ms=20)
+    insert_all(committer, ["a", "b", "c"])
+    assert batches == [[("a", 1), ("b", 1)], [("c", 1)]]
+    assert committer.stats()["batches"] == 2
+
+
+def test_flushes_after_max_wait(batches):
+    committer = GroupCommitter(max_rows=100, max_wait_ms=20)
+    start = time.monotonic()
+    insert_all(committer, ["a", "b"])
+    assert time.monotonic() - start >= 0.02
+    assert batches == [[("a", 1), ("b", 1)]]
+
+
+def test_failed_row_fails_only_its_request(batches):
+    committer = GroupCommitter(max_rows=3, max_wait_ms=20)
+    results = insert_all(committer, ["a", "bad", "c"])
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], HTTPException) and results[1].status_code == 500
+    stats = committer.stats()
+    assert stats["rows"] == 3 and stats["failed_rows"] == 1
+
+
+class FakeSession:
+    def __init__(self):
+        self.rollbacks = 0
+        self.closed = False
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = FakeSession()
+    inserts = []
+
+    def insert_rows(db, table_name, name_column, age_column, rows):
+        inserts.append(list(rows))
+        if any(name == "bad" for name, _ in rows):
+            raise ValueError("bad row")
+
+    monkeypatch.setattr(group_commit, "SessionLocal", lambda: session)
+    monkeypatch.setattr(group_commit, "insert_rows", insert_rows)
+    session.inserts = inserts
+    return session
+
+
+def test_commit_batch_in_one_transaction(session):
+    assert _commit_batch(*KEY, [("a", 1), ("b", 2)]) == [None, None]
+    assert session.inserts == [[("a", 1), ("b", 2)]]
+    assert session.closed
+
+
+def test_commit_batch_falls_back_to_one_row_at_a_time(session):
+    errors = _commit_batch(*KEY, [("a", 1), ("bad", 2), ("c", 3)])
+    assert errors[0] is None and errors[2] is None
+    assert isinstance(errors[1], ValueError)
+    # The whole batch, then each row on its own
+    assert session.inserts == [[("a", 1), ("bad", 2), ("c", 3)], [("a", 1)], [("bad", 2)], [("c", 3)]]
+    assert session.rollbacks == 2
+    assert session.closed
+
+
+def test_commit_batch_single_row_is_not_retried(session):
+    errors = _commit_batch(*KEY, [("bad", 1)])
+    assert isinstance(errors[0], ValueError)
+    assert session.inserts == [[("bad", 1)]]
@@ -0,0 +1,82 @@
+import pytest
+from fastapi import HTTPException
+from crud import build_table_query
+from models import QueryTableRequest
+
+COLUMNS = {"name": "name", "age": "age", "id": "id", "created_at": "created_at"}
+
+
+def build(columns=COLUMNS, table_name="people", **fields):
+    return build_table_query(QueryTableRequest(table_name=table_name, username="u", **fields), table_name, columns)
+
+
+def sql(query):
+    return " ".join(query.split())
+
+
+def test_plain_rows_are_ordered_by_id():
+    query, params = build()
+    assert sql(query) == 'SELECT * FROM "people" ORDER BY "id" ASC;'
+    assert params == {}
+
+
+def test_filters_and_limit():
+    query, params = build(min_age=18, max_age=30, order_by="age", descending=True, limit=5)
+    assert sql(query) == 'SELECT * FROM "people" WHERE "age" >= :min_age AND "age" <= :max_age ORDER BY "age" DESC LIMIT :limit;'
+    assert params == {"min_age": 18, "max_age": 30, "limit": 5}
+
+
+def test_name_prefix_escapes_like_wildcards():
+    query, params = build(name_prefix="a_b%c\\")
+    assert '"name" LIKE :name_prefix' in query
+    assert params == {"name_prefix": "a\\_b\\%c\\\\%"}
+
+
+def test_renamed_columns_are_used():
+    columns = {"name": "full name", "age": "years"}
+    query, _ = build(columns, min_age=1, name_prefix="a", order_by="name")
+    assert sql(query) == 'SELECT * FROM "people" WHERE "years" >= :min_age AND "full name" LIKE :name_prefix ORDER BY "full name" ASC;'
+
+
+def test_missing_order_column_is_rejected():
+    with pytest.raises(HTTPException) as e:
+        build({"name": "name", "age": "age"})
+    assert e.value.status_code == 400
+    with pytest.raises(HTTPException) as e:
+        build(order_by="count")
+    assert e.value.status_code == 400
+
+
+def test_aggregates_without_groups():
+    query, params = build(aggregates=["count", "avg", "count"], min_age=1)
+    assert sql(query) == 'SELECT COUNT(*) AS count, AVG("age") AS avg FROM "people" WHERE "age" >= :min_age;'
+    assert params == {"min_age": 1}
+
+
+def test_group_by_counts_by_default():
+    query, _ = build({"name": "n", "age": "a"}, group_by="name", descending=True)
+    assert sql(query) == 'SELECT "n" AS name, COUNT(*) AS count FROM "people" GROUP BY "n" ORDER BY name DESC;'
+
+
+def test_groups_ordered_by_an_aggregate():
+    query, _ = build(group_by="age", aggregates=["max"], order_by="max")
+    assert sql(query) == 'SELECT "age" AS age, MAX("age") AS max FROM "people" GROUP BY "age" ORDER BY max ASC;'
+
+
+@pytest.mark.parametrize("order_by", ["id", "name", "avg"])
+def test_groups_ordered_by_anything_else_are_rejected(order_by):
+    with pytest.raises(HTTPException) as e:
+        build(group_by="age", aggregates=["count"], order_by=order_by)
+    assert e.value.status_code == 400
+
+
+def test_table_name_is_quoted():
+    query, _ = build(table_name='x"; DROP TABLE t; --')
+    assert sql(query) == 'SELECT * FROM "x""; DROP TABLE t; --" ORDER BY "id" ASC;'
+
+
+def test_colons_in_names_are_not_bind_parameters():
+    from sqlalchemy import text
+
+    query, params = build({"name": "n :x", "age": "a:y"}, table_name="t :z", min_age=1, order_by="name")
+    assert set(text(query).compile().params) == set(params) == {"min_age"}
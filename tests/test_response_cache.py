@@ -0,0 +1,96 @@
+import pytest
+from starlette.requests import Request
+import main
+from cache import MemoryResponseBackend, ResponseCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ResponseCache(MemoryResponseBackend(ttl=60, maxsize=16))
+    monkeypatch.setattr(main, "response_cache", cache)
+    return cache
+
+
+def request(if_none_match: str = None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def serve(req, build, **kwargs):
+    return main._cached_response(req, "get_info_table", "t", "", build, **kwargs)
+
+
+def test_builds_once_then_serves_from_cache(cache):
+    builds = []
+    build = lambda: builds.append(1) or {"rows": [1]}
+    first = serve(request(), build)
+    second = serve(request(), build)
+    assert first.status_code == second.status_code == 200
+    assert first.body == second.body
+    assert first.headers["etag"] == second.headers["etag"]
+    assert len(builds) == 1
+
+
+@pytest.mark.parametrize("header", ["{etag}", 'W/{etag}', '"other", {etag}', "*"])
+def test_not_modified(cache, header):
+    etag = serve(request(), lambda: {"rows": [1]}).headers["etag"]
+    response = serve(request(header.format(etag=etag)), lambda: {"rows": [1]})
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == etag
+
+
+def test_stale_etag_gets_the_new_body(cache):
+    etag = serve(request(), lambda: {"rows": [1]}).headers["etag"]
+    cache.invalidate_tables("t")
+    response = serve(request(etag), lambda: {"rows": [2]})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_unstored_response_still_answers_304(cache):
+    etag = serve(request(), lambda: {"rows": [1]}, store=False).headers["etag"]
+    assert cache.get("get_info_table", "t", "") is None
+    assert serve(request(etag), lambda: {"rows": [1]}, store=False).status_code == 304
+
+
+def test_body_built_during_a_write_is_not_stored(cache):
+    def build():
+        # Another request writes to the table while this body is being built
+        cache.invalidate_tables("t")
+        return {"rows": [1]}
+
+    serve(request(), build)
+    assert cache.get("get_info_table", "t", "") is None
+
+
+@pytest.fixture
+def redis_caches(monkeypatch):
+    """Two workers' response caches on one in-memory Redis server"""
+    fakeredis = pytest.importorskip("fakeredis")
+    import redis
+    from cache import RedisResponseBackend
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, "from_url", classmethod(lambda cls, url: fakeredis.FakeRedis(server=server)))
+    return [ResponseCache(RedisResponseBackend("redis://test", ttl=60)) for _ in range(2)]
+
+
+def test_redis_invalidation_is_seen_by_other_workers(redis_caches):
+    a, b = redis_caches
+    a.set("get_info_table", "t:1", "v", b"old", a.generation("get_info_table", "t:1"))
+    assert b.get("get_info_table", "t:1", "v")[0] == b"old"
+    b.invalidate_tables("t:1")
+    assert a.get("get_info_table", "t:1", "v") is None
+    # Other tables keep their entries
+    a.set("get_info_table", "t", "v", b"kept", 0)
+    b.invalidate_tables("t:1")
+    assert a.get("get_info_table", "t", "v")[0] == b"kept"
+
+
+def test_redis_body_built_before_another_workers_write_is_not_served(redis_caches):
+    a, b = redis_caches
+    generation = a.generation("get_info_table", "t")
+    b.invalidate_tables("t")
+    a.set("get_info_table", "t", "v", b"old", generation)
+    assert b.get("get_info_table", "t", "v") is None
@@ -0,0 +1,37 @@
+import pytest
+from sqlalchemy.dialects import postgresql
+from statements import quote, statement
+
+
+def render(query):
+    compiled = query.compile(dialect=postgresql.dialect())
+    return str(compiled), set(compiled.params)
+
+
+def test_values_stay_bind_parameters():
+    sql, params = render(statement("select_page", "people"))
+    assert sql == 'SELECT * FROM "people" WHERE id > %(after_id)s ORDER BY id LIMIT %(limit)s;'
+    assert params == {"after_id", "limit"}
+
+
+@pytest.mark.parametrize("table_name", ['x"; DROP TABLE t; --', "x :y", "a:b", "Mixed Case", "таблица"])
+def test_any_table_name_is_one_identifier(table_name):
+    sql, params = render(statement("count", table_name))
+    # The compiler prints the identifier the way PostgreSQL needs it
+    assert sql == f"SELECT COUNT(*) FROM {quote(table_name)};"
+    assert params == set()
+
+
+def test_colons_in_column_names_are_not_parameters():
+    sql, params = render(statement("insert", "t", name_column="n :x", age_column="a:y"))
+    assert sql == 'INSERT INTO "t" ("n :x", "a:y") VALUES (%(name)s, %(age)s);'
+    assert params == {"name", "age"}
+
+
+def test_column_lists():
+    sql, _ = render(statement("select_columns", "t", columns=("id", "full name")))
+    assert sql == 'SELECT "id", "full name" FROM "t";'
+
+
+def test_statements_are_cached():
+    assert statement("count", "cached") is statement("count", "cached")
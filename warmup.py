@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import os
+import time
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from cache import response_cache
+from crud import create_roles, get_role_memberships, list_public_tables, load_table_schemas
+from database import DB_POOL_SIZE, SessionLocal, async_engine, engine, replicas
+from serialization import render_json
+
+# Warm-up runs in the background when the app starts; /ready reports when it is done
+WARMUP = os.getenv("WARMUP", "true").lower() in ["1", "true", "yes"]
+# Pooled connections opened ahead of the first requests, at most DB_POOL_SIZE
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", str(DB_POOL_SIZE)))
+WARMUP_CREATE_ROLES = os.getenv("WARMUP_CREATE_ROLES", "true").lower() in ["1", "true", "yes"]
+# Seconds between attempts while the database is unreachable
+WARMUP_RETRY_S = float(os.getenv("WARMUP_RETRY_S", "5"))
+
+logger = logging.getLogger(__name__)
+
+status = {"ready": False, "attempts": 0, "error": None, "duration_ms": None, "connections": 0, "tables": 0}
+
+
+def _open_connections(count: int):
+    # Hold them all at once so the pool really grows to `count`
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
+
+
+def warm_up():
+    """Open pooled connections and load the roles, table list and column layouts the first requests need"""
+    connections = _open_connections(min(WARMUP_CONNECTIONS, DB_POOL_SIZE))
+    for replica in replicas:
+        replica.check()
+
+    db = SessionLocal()
+    try:
+        if WARMUP_CREATE_ROLES:
+            try:
+                create_roles(db)
+            except HTTPException as e:
+                # Typically a database user without CREATEROLE; /init-system reports the same
+                logger.warning("Warm-up could not create roles: %s", e.detail)
+        get_role_memberships(db)
+
+        generation = response_cache.generation("get_all_tables", "")
+        tables = list_public_tables(db)
+        body = render_json("get_all_tables", {"tables": tables})
+        response_cache.set("get_all_tables", "", "", body, generation)
+        load_table_schemas(db)
+    finally:
+        db.close()
+    return connections, len(tables)
+
+
+async def _open_async_connections(count: int):
+    connections = [await async_engine.connect() for _ in range(count)]
+    for connection in connections:
+        await connection.close()
+
+
+async def run_warm_up():
+    """Warm up, retrying until the database is reachable, then mark the app ready"""
+    start = time.perf_counter()
+    while True:
+        status["attempts"] += 1
+        try:
+            status["connections"], status["tables"] = await run_in_threadpool(warm_up)
+            break
+        except Exception as e:
+            status["error"] = str(e)
+            logger.warning("Warm-up failed, retrying in %.0f s: %s", WARMUP_RETRY_S, e)
+            await asyncio.sleep(WARMUP_RETRY_S)
+
+    if async_engine is not None:
+        try:
+            await _open_async_connections(min(WARMUP_CONNECTIONS, DB_POOL_SIZE))
+        except Exception as e:
+            # Only the /async routes use this pool; they still connect on demand
+            logger.warning("Warm-up of the async pool failed: %s", e)
+
+    status.update(ready=True, error=None, duration_ms=(time.perf_counter() - start) * 1000)